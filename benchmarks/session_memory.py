@@ -0,0 +1,148 @@
+"""
+Memory used by idle sessions: bytes per ChatGPTProxy (V3).
+
+    python benchmarks/session_memory.py [-n 2000] [--history 10]
+
+Creates n sessions from the same initial_prompt, each with `history` chat
+turns already in it, asks each one prompt (against a local fake upstream,
+in a child process), and reports tracemalloc bytes per session, as they are
+kept after that:
+
+- before: the sessions as they were kept before (a revChatGPT Chatbot with
+          its http session per ChatGPTv3, the history as message dicts);
+- after:  ChatGPTProxy sessions as they are kept now (compact history, the
+          Chatbots shared by v3_chatbots).
+
+No request leaves the box.
+"""
+
+import argparse
+import gc
+import multiprocessing
+import os
+import socket
+import sys
+import threading
+import time
+import tracemalloc
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "chatgpt"))
+
+from revChatGPT.V3 import Chatbot as ChatbotV3  # noqa: E402
+
+from chatbot import APIVersion, ChatGPTConfig, ChatGPTProxy  # noqa: E402
+from replay import FakeUpstream  # noqa: E402
+
+INITIAL_PROMPT = "You are muvtuber, a cute vtuber live streaming. " * 8
+UPSTREAM = ("localhost", 50097)
+
+
+class BeforeV3:
+    """ChatGPTv3 as it was: a revChatGPT Chatbot per session"""
+
+    def __init__(self, config: dict):
+        self.chatbot = ChatbotV3(api_key=config["api_key"], max_tokens=3000,
+                                 system_prompt=config["initial_prompt"])
+        self.lock = threading.Lock()
+
+    def ask(self, prompt: str) -> str:
+        with self.lock:
+            return self.chatbot.ask(prompt)
+
+
+class BeforeProxy:
+    """ChatGPTProxy as it was"""
+
+    def __init__(self, session_id: str, config: dict):
+        self.session_id = session_id
+        self.config = config
+        self.initial_response = ""
+        self.create_at = 0
+        self.touch_at = 0
+        self.chatgpt = BeforeV3(config)
+
+
+def new_config():
+    # new strs per session, as parsed from each NewSession request
+    return "".join(["sk-", "x" * 48]), "".join([INITIAL_PROMPT])
+
+
+def seed(i: int, history: int):
+    return [(role, f"message {j} of session {i}")
+            for j in range(history)
+            for role in ("user", "assistant")]
+
+
+def before_sessions(n: int, history: int):
+    sessions = []
+    for i in range(n):
+        api_key, initial_prompt = new_config()
+        s = BeforeProxy(f"session-{i:08d}", {"api_key": api_key, "initial_prompt": initial_prompt})
+        s.chatgpt.chatbot.conversation["default"] += [
+            {"role": role, "content": content} for role, content in seed(i, history)]
+        s.chatgpt.ask(f"prompt of session {i}")
+        sessions.append(s)
+    return sessions
+
+
+def after_sessions(n: int, history: int):
+    sessions = []
+    for i in range(n):
+        api_key, initial_prompt = new_config()
+        config = ChatGPTConfig(version=APIVersion.V3, access_token=api_key,
+                               initial_prompt=initial_prompt)
+        s = ChatGPTProxy(f"session-{i:08d}", config, create_now=True)
+        s.chatgpt.history = seed(i, history)
+        s.ask(s.session_id, f"prompt of session {i}", no_cooldown=True)
+        sessions.append(s)
+    return sessions
+
+
+def measure(fn, *args) -> int:
+    gc.collect()
+    before = tracemalloc.get_traced_memory()[0]
+    result = fn(*args)
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0] - before
+    del result
+    return used
+
+
+def serve_upstream():
+    FakeUpstream(UPSTREAM, ttfb=0, tps=10000, reply_chars=40, rpm=10 ** 9).serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("-n", type=int, default=2000, help="number of sessions (default 2000)")
+    parser.add_argument("--history", type=int, default=10, help="chat turns per session (default 10)")
+    args = parser.parse_args()
+
+    # a child process: the fake upstream's threads are not traced
+    upstream = multiprocessing.Process(target=serve_upstream, daemon=True)
+    upstream.start()
+    while True:
+        try:
+            socket.create_connection(UPSTREAM).close()
+            break
+        except ConnectionRefusedError:
+            time.sleep(0.1)
+    os.environ["API_URL"] = f"http://{UPSTREAM[0]}:{UPSTREAM[1]}/v1/chat/completions"
+
+    # warm up (lazy imports, tiktoken encodings, v3_chatbots): not per session
+    before_sessions(1, args.history)
+    after_sessions(1, args.history)
+
+    tracemalloc.start()
+    before = measure(before_sessions, args.n, args.history)
+    after = measure(after_sessions, args.n, args.history)
+    tracemalloc.stop()
+    upstream.terminate()
+
+    print(f"sessions: {args.n} (history: {args.history} turns, 1 ask each)")
+    print(f"before:   {before / args.n:10.0f} bytes/session")
+    print(f"after:    {after / args.n:10.0f} bytes/session")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,9 +7,48 @@ Environment variables:
 GRPC_REFLECTION:  if set to True, gRPC server will enable server reflection.
                   --debug will set this to True automatically.
                   (default: False)
+GRPC_MAX_IN_FLIGHT, GRPC_MAX_QUEUED: at most GRPC_MAX_IN_FLIGHT Chat/NewSession
+                  calls run at a time (worker threads), GRPC_MAX_QUEUED more
+                  wait for them (in queues, not threads). Others get
+                  RESOURCE_EXHAUSTED with a retry-after trailer.
+                  (default: 10, 10)
+GRPC_MAX_SESSION_QUEUE: Chat calls of a session run one at a time, in order;
+                  at most this many waiting or running. Others get
+                  RESOURCE_EXHAUSTED at once. (default: 4)
+GRPC_DRAIN_GRACE: on SIGTERM, new calls are rejected and in-flight calls
+                  have this many seconds to finish (default: 30)
 CHATGPT_COOLDOWN: the cooldown time (in seconds) between two consecutive 
                   requests to a ChatGPT instance (access_token)
                   (default: 75)
+CHATGPT_V3_COOLDOWN: the initial cooldown (in seconds) between two requests
+                  with the same api_key (V3). It adapts to the upstream
+                  x-ratelimit-* and Retry-After headers at runtime.
+                  (default: 15)
+CHATGPT_V3_MIN_COOLDOWN, CHATGPT_V3_MAX_COOLDOWN: bounds of the adaptive
+                  V3 cooldown (default: 3, 120)
+CHATGPT_V3_TPM:   tokens per minute budget of an api_key (V3). Each request
+                  takes max_tokens (3000: what upstream counts for it, used
+                  or not), given back only if it is not sent.
+                  (default: 40000)
+CHATGPT_V3_TPM_MAX_WAIT: max seconds a request waits for the TPM budget
+                  before RESOURCE_EXHAUSTED (default: 10). HTTP API
+                  requests do not wait.
+CHATGPT_V3_ROUTES: JSON list of rules choosing the model of each V3 Chat,
+                  the first matching wins (default: [], GPT_ENGINE or
+                  gpt-3.5-turbo). Conditions: max_prompt, min_prompt (chars),
+                  tiers (NewSession config "tier"), max_in_flight,
+                  max_latency (seconds, EWMA), max_hourly_cost (USD). e.g.
+                  [{"model": "gpt-3.5-turbo", "max_prompt": 100},
+                   {"model": "gpt-4", "tiers": ["pro"], "max_latency": 30}]
+CHATGPT_LOG_FORMAT:   "text" or "json": structured log lines (default: text)
+CHATGPT_LOG_SAMPLING: per-event sample rates for events below WARNING,
+                      e.g. "Chat.ok=0.1" (default: log every event)
+CHATGPT_LOG_MAX_BODY: truncate logged prompt/response bodies to this many
+                      characters, 0 to omit them (default: 200)
+CHATGPT_TRACE_FILE:   record a trace of the gRPC calls to this file, for
+                      chatgpt/replay.py (default: no recording)
+CHATGPT_TRACE_BODIES: if set to True, the trace includes the prompts, not
+                      just their lengths & hashes (default: False)
 
 """
 
@@ -27,6 +66,7 @@ import os
 
 import httpapi
 import grpcapi
+import eventlog
 
 # 🤬艹尼玛，导入永远写不对！！！！
 #
@@ -74,6 +114,5 @@ def main():
 
 
 if __name__ == "__main__":
-    logging.basicConfig()
-    logging.getLogger().setLevel(logging.INFO)
+    eventlog.setup_logging(logging.INFO)
     main()
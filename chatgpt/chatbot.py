@@ -3,16 +3,20 @@ from abc import ABCMeta, abstractmethod
 from dataclasses import dataclass
 import os
 from enum import Enum
+import sys
 import time
-from typing import Dict
+from concurrent.futures import Future
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple
 import uuid
 from warnings import warn
 from revChatGPT.V1 import Chatbot as ChatbotV1
 from revChatGPT.V3 import Chatbot as ChatbotV3
 import threading
-from datetime import datetime
 from threading import Timer
-from cooldown import cooldown
+from cooldown import cooldown, AdaptiveCooldown, CooldownException, TokenBudget
+from dispatcher import Dispatcher
+from eventlog import log_event
+from router import ModelRouter, parse_rules
 import re # added for emoji filter
 
 
@@ -43,6 +47,51 @@ def filter_response(text):
     return filtered_text
 
 
+SENTENCE_ENDS = "。！？!?…\n"  # and ". " (an ASCII period followed by a space)
+CLAUSE_ENDS = "，、；：,"       # cut at these too, once a chunk is long enough
+CLOSERS = "”’\"')）」』】》"   # stay with the sentence before them
+# a period after these does not end a sentence: "e.g. this", "U.S. is", "Dr. Who"
+# (a single letter does: "plan B. It", "So do I. Then")
+ABBREVIATIONS = re.compile(r"(?:[A-Za-z]\.)+[A-Za-z]|Mr|Mrs|Ms|Dr|Prof|St|Jr|Sr|vs|cf",
+                           re.IGNORECASE)
+
+
+def _sentence_end(buf: str, min_clause: int) -> int:
+    """index after the first complete sentence in buf, or -1 if none yet"""
+    for i, c in enumerate(buf):
+        if c not in SENTENCE_ENDS and c != "." and \
+                not (c in CLAUSE_ENDS and i >= min_clause):
+            continue
+        j = i + 1  # take following ends & closers: "！？", "……", "。」"
+        while j < len(buf) and (buf[j] in SENTENCE_ENDS or buf[j] in CLOSERS or buf[j] == "."):
+            j += 1
+        if j == len(buf):
+            return -1  # the next delta may continue it
+        if c in ".," and not buf[j].isspace():
+            continue  # 3.14, e.g.x, example.com, 12,000
+        if c == "." and (word := re.search(r"[A-Za-z.]*$", buf[:i])) and \
+                ABBREVIATIONS.fullmatch(word.group()):
+            continue
+        return j
+    return -1
+
+
+def chunk_sentences(deltas: Iterable[str], min_clause: int = 20) -> Iterator[str]:
+    """Re-chunk streamed text deltas into sentences (mixed Chinese & English).
+
+    A sentence is yielded as soon as it is complete. Clauses (split at
+    commas, ...) are yielded once they reach min_clause characters.
+    """
+    buf = ""
+    for delta in deltas:
+        buf += delta
+        while (end := _sentence_end(buf, min_clause)) != -1:
+            yield buf[:end]
+            buf = buf[end:]
+    if buf:
+        yield buf
+
+
 # Proxy server Rate limit: 25 requests per 10 seconds (per IP)
 # OpenAI rate limit: 50 requests per hour on free accounts. You can get around it with multi-account cycling
 # Plus accounts has around 150 requests per hour rate limit
@@ -53,6 +102,8 @@ def filter_response(text):
 
 
 class ChatGPT(metaclass=ABCMeta):
+    __slots__ = ()
+
     @abstractmethod
     def ask(self, session_id, prompt, **kwargs):
         """Ask ChatGPT with prompt, return response text
@@ -62,6 +113,16 @@ class ChatGPT(metaclass=ABCMeta):
         """
         pass
 
+    def ask_stream(self, session_id, prompt, **kwargs) -> Iterator[str]:
+        """Ask ChatGPT with prompt, yield the response in sentences.
+
+        Default: the whole response of ask() at once.
+
+        Raises:
+            ChatGPTError: ChatGPT error
+        """
+        yield self.ask(session_id, prompt, **kwargs)
+
 
 # V1 Standard ChatGPT
 # Update 2023/03/09 9:50AM - No longer functional
@@ -74,7 +135,8 @@ class ChatGPTv1(ChatGPT):
         q = config.get('initial_prompt', None)
         if q:
             a = self.ask('', q, no_cooldown=True)
-            print(f'{datetime.now()} ChatGPT initial ask: {q} -> {a}')
+            log_event(logging.INFO, 'ChatGPTv1.initial_ask',
+                      prompt=q, response=a)
             self.initial_response = a
         else:
             self.initial_response = None
@@ -98,7 +160,8 @@ class ChatGPTv1(ChatGPT):
             raise ChatGPTError("ChatGPT response is None")
 
         if response.get("detail", None) != None:  # error
-            print(f'{datetime.now()} ChatGPT ask error: {response}')
+            log_event(logging.WARNING, 'ChatGPTv1.ask_error',
+                      response=response)
             raise ChatGPTError(str(response))
 
         resp = response.get("message", None)
@@ -114,18 +177,111 @@ class ChatGPTv1(ChatGPT):
             self.chatbot = ChatbotV1(config={"access_token": access_token})
 
 
+# Rate Limits: 20 RPM / 40,000 TPM
+# https://platform.openai.com/docs/guides/rate-limits/overview
+#
+# Shared by all ChatGPTv3 instances, keyed by api_key: starts at
+# CHATGPT_V3_COOLDOWN and adapts to the upstream x-ratelimit-* / Retry-After
+# headers within [CHATGPT_V3_MIN_COOLDOWN, CHATGPT_V3_MAX_COOLDOWN].
+v3_cooldown = AdaptiveCooldown(
+        seconds=float(os.getenv("CHATGPT_V3_COOLDOWN", 15)),
+        min_seconds=float(os.getenv("CHATGPT_V3_MIN_COOLDOWN", 3)),
+        max_seconds=float(os.getenv("CHATGPT_V3_MAX_COOLDOWN", 120)))
+
+# Also keyed by api_key: the tokens of each request (ChatGPTv3.max_tokens)
+# are reserved from a CHATGPT_V3_TPM bucket before sending. Requests are delayed up to
+# CHATGPT_V3_TPM_MAX_WAIT seconds for the budget (on the Dispatcher's timer,
+# not a thread), or rejected. Direct asks (not on the Dispatcher) are not delayed.
+v3_token_budget = TokenBudget(
+        tpm=int(os.getenv("CHATGPT_V3_TPM", 40000)),
+        max_wait=float(os.getenv("CHATGPT_V3_TPM_MAX_WAIT", 10)))
+
+
+V3_ENGINE = os.environ.get("GPT_ENGINE") or "gpt-3.5-turbo"  # revChatGPT's default
+
+# The model of each V3 ask: by CHATGPT_V3_ROUTES rules (prompt length,
+# session tier, and the models' in-flight asks, latency & cost so far),
+# V3_ENGINE if none matches.
+v3_router = ModelRouter(parse_rules(os.getenv("CHATGPT_V3_ROUTES", "")),
+                        default=V3_ENGINE)
+
+
+@dataclass(slots=True)
+class Admission:
+    """Admission: the TPM budget reserved & the cooldown slot taken for an ask,
+    to be sent at ready_at (unix time)."""
+    api_key: str
+    reserved: int
+    ready_at: float
+
+    def cancel(self):
+        """the ask is dropped before sent: give back the reserved tokens"""
+        v3_token_budget.release(self.api_key, self.reserved)
+
+
+class ChatbotPool:
+    """ChatbotPool: idle revChatGPT Chatbots (each with its http session) per
+    api_key, shared by all ChatGPTv3 sessions.
+
+    An ask checks one out with get() and gives it back with put(): there are
+    as many Chatbots as asks running at once, not one per session.
+    """
+
+    def __init__(self, max_tokens: int):
+        self.max_tokens = max_tokens
+        self._idle: Dict[str, List[ChatbotV3]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, api_key: str) -> ChatbotV3:
+        with self._lock:
+            idle = self._idle.get(api_key)
+            if idle:
+                return idle.pop()
+        chatbot = ChatbotV3(api_key=api_key, max_tokens=self.max_tokens)
+        # timeout=30,     # TODO: update to acheong08/ChatGPT#1199
+        chatbot.session.hooks['response'].append(
+                lambda response, *args, **kwargs: _on_v3_response(api_key, response))
+        return chatbot
+
+    def put(self, api_key: str, chatbot: ChatbotV3):
+        chatbot.conversation['default'] = []  # do not keep the last history alive
+        with self._lock:
+            self._idle.setdefault(api_key, []).append(chatbot)
+
+
+def _on_v3_response(api_key: str, response):
+    """requests response hook: feed rate-limit headers to v3_cooldown & v3_token_budget"""
+    v3_cooldown.observe(api_key, response.status_code, response.headers)
+    v3_token_budget.observe(api_key, response.headers)
+
+
 # V3 Official Chat API
 # Paid
 class ChatGPTv3(ChatGPT):
+    """ChatGPTv3 keeps the conversation compact between asks:
+
+    - the system prompt is interned: shared by sessions with the same one;
+    - history is a list of (role, content) tuples, expanded into the
+      revChatGPT message dicts only for the duration of an ask;
+    - the revChatGPT Chatbot (http clients, ...) is borrowed from v3_chatbots
+      for the duration of an ask.
+    """
+    __slots__ = ('api_key', 'system_prompt', 'history', 'lock',
+                 'last_usage', 'last_latency')
+
+    max_tokens = 3000  # 太长容易忘记 system_prompt
+    initial_response = None  # V3 does not ask the initial_prompt
+
     def __init__(self, config={'api_key': 'your api key', 'initial_prompt': ''}):
         system_prompt = config.get('initial_prompt', None) or \
                 'You are muvtuber, a cute vtuber live streaming'
-        self.chatbot = ChatbotV3(
-                api_key=config.get('api_key', ''), 
-                max_tokens=3000,  # 太长容易忘记 system_prompt
-                # timeout=30,     # TODO: update to acheong08/ChatGPT#1199
-                system_prompt=system_prompt)
-        self.lock = threading.Lock()  # for self.chatbot
+        self.api_key = sys.intern(config.get('api_key', ''))
+        self.system_prompt = sys.intern(system_prompt)
+        self.history: List[Tuple[str, str]] = []  # [(role, content)], w/o system prompt
+        self.lock = threading.Lock()  # for self.history
+
+        self.last_usage = 0  # tokens used by the last ask
+        self.last_latency = 0.0  # seconds the last ask took upstream (0: not sent)
 
         # q = config.get('initial_prompt', None)
         # if q:
@@ -135,28 +291,100 @@ class ChatGPTv3(ChatGPT):
         # else:
         #     self.initial_response = None
 
-    # Rate Limits: 20 RPM / 40,000 TPM
-    # https://platform.openai.com/docs/guides/rate-limits/overview
     # 主要是价格w
     # gpt-3.5-turbo: $0.002 / 1K tokens
 
-    @cooldown(int(os.getenv("CHATGPT_V3_COOLDOWN", 15)))
-    def ask(self, session_id, prompt, **kwargs) -> str:  # raises Exception
-        """Ask ChatGPT with prompt, return response text
+    def _expand_history(self) -> List[dict]:
+        return [{"role": "system", "content": self.system_prompt}] + \
+            [{"role": role, "content": content} for role, content in self.history]
 
-        - session_id: unused
+    def _compact_history(self, conversation: List[dict]):
+        # conversation[0] is the system prompt: revChatGPT never drops it
+        self.history = [(sys.intern(m["role"] or "assistant"), m["content"])
+                        for m in conversation[1:]]
+
+    def admit(self, max_wait: float | None = None) -> Admission:
+        """Reserve the TPM budget and take a cooldown slot for the next ask.
+
+        - max_wait: seconds the ask may wait for the budget
+          (default: CHATGPT_V3_TPM_MAX_WAIT)
+
+        Returns the Admission: the ask is to be sent at its ready_at.
 
         Raises:
+            CooldownException: rate limited
+        """
+        # revChatGPT truncates history + prompt to max_tokens and asks for the
+        # rest as the completion: upstream counts max_tokens for every ask.
+        reserved = self.max_tokens
+        v3_cooldown.check(self.api_key)  # do not take the budget to be rejected
+        ready_at = v3_token_budget.reserve(self.api_key, reserved, max_wait=max_wait)
+        try:
+            v3_cooldown.acquire(self.api_key, at=ready_at)
+        except CooldownException:
+            v3_token_budget.release(self.api_key, reserved)
+            raise
+        return Admission(self.api_key, reserved, ready_at)
+
+    def _ask_deltas(self, prompt, **kwargs) -> Iterator[str]:
+        """Ask ChatGPT with prompt, yield the raw response deltas as they arrive.
+
+        - model: the engine to ask (default: V3_ENGINE)
+        - admission: of admit(), taken ahead (by MultiChatGPT's dispatcher),
+          sent at its ready_at. Otherwise the ask is admitted here, not
+          waiting: rejected if the TPM budget is short now.
+
+        Holds self.lock until the response is complete (or the generator closed).
+
+        Raises:
+            CooldownException: api_key is rate limited (v3_cooldown, v3_token_budget)
             ChatGPTError: ChatGPT error
         """
-        response: str | None = None
+        self.last_latency = 0.0
+        admission = kwargs.get('admission')
+        if admission is None and not kwargs.get('no_cooldown', False):
+            # not on the dispatcher: no timer to delay it on, and no thread is to wait
+            admission = self.admit(max_wait=0)
+
+        usage = 0
+        sent = False
 
         try:
             with self.lock:
-                response = self.chatbot.ask(prompt)
+                chatbot = v3_chatbots.get(self.api_key)
+                chatbot.engine = kwargs.get('model') or V3_ENGINE
+                conversation = chatbot.conversation['default'] = self._expand_history()
+                if admission is not None:
+                    # charged in full from here: upstream counts max_tokens, used or not
+                    v3_token_budget.commit(self.api_key, admission.reserved)
+                sent = True
+                start = time.time()  # not the time waiting for admission or the lock
+                try:
+                    yield from chatbot.ask_stream(prompt)
+                    usage = chatbot.get_token_count('default')
+                finally:
+                    self.last_latency = time.time() - start
+                    self._compact_history(conversation)
+                    v3_chatbots.put(self.api_key, chatbot)
         except Exception as e:
-            logging.warning(f"ChatGPT ask error: {e}")
+            log_event(logging.WARNING, 'ChatGPTv3.ask_error', error=e)
             raise ChatGPTError(str(e))
+        finally:
+            if admission is not None and not sent:
+                admission.cancel()
+
+        self.last_usage = usage
+
+    def ask(self, session_id, prompt, **kwargs) -> str:  # raises Exception
+        """Ask ChatGPT with prompt, return response text
+
+        - session_id: unused
+
+        Raises:
+            CooldownException: api_key is rate limited (v3_cooldown, v3_token_budget)
+            ChatGPTError: ChatGPT error
+        """
+        response = "".join(self._ask_deltas(prompt, **kwargs))
 
         if not response:
             raise ChatGPTError("ChatGPT response is None")
@@ -164,6 +392,25 @@ class ChatGPTv3(ChatGPT):
         filteredemoji_resp = filter_response(response) #filter emoji on response
         return filteredemoji_resp #return filtered message
 
+    def ask_stream(self, session_id, prompt, **kwargs) -> Iterator[str]:
+        """Ask ChatGPT with prompt, yield the response sentence by sentence,
+        each filtered as soon as it is complete.
+
+        - session_id: unused
+
+        Raises:
+            CooldownException: api_key is rate limited (v3_cooldown, v3_token_budget)
+            ChatGPTError: ChatGPT error
+        """
+        for sentence in chunk_sentences(self._ask_deltas(prompt, **kwargs)):
+            sentence = filter_response(sentence).strip()
+            if sentence:
+                yield sentence
+
+
+# revChatGPT Chatbots of all V3 sessions, by api_key
+v3_chatbots = ChatbotPool(max_tokens=ChatGPTv3.max_tokens)
+
 
 class APIVersion(Enum):
     V1 = 1
@@ -176,19 +423,47 @@ class APIVersion(Enum):
             return ChatGPTv3
 
 
-# ChatGPTConfig: {access_token, initial_prompt}
-@dataclass
+# ChatGPTConfig: {access_token, initial_prompt, tier}
+@dataclass(slots=True)
 class ChatGPTConfig:
     version: APIVersion
     access_token: str
     initial_prompt: str
+    tier: str = ""  # for CHATGPT_V3_ROUTES rules
+
+    def __post_init__(self):
+        # shared by the sessions created with the same key / prompt / tier
+        self.access_token = sys.intern(self.access_token)
+        self.initial_prompt = sys.intern(self.initial_prompt)
+        self.tier = sys.intern(self.tier)
 
 
 MAX_SESSIONS = 10
 
 
+@dataclass(slots=True)
+class SessionStats:
+    """SessionStats: a snapshot of a ChatGPTProxy, for operators"""
+    session_id: str
+    create_at: float
+    touch_at: float
+    history_size: int
+    zombie: bool
+    requests: int
+    rejected: int
+    last_latency: float
+    tokens: int
+    queue_depth: int
+    tier: str
+    model: str  # of the last ask
+
+
 class ChatGPTProxy(ChatGPT):
     """ChatGPTProxy is a ChatGPT used by MultiChatGPT."""
+    __slots__ = ('session_id', 'config', 'initial_response',
+                 'create_at', 'touch_at', 'chatgpt',
+                 'requests', 'rejected', 'last_latency', 'tokens', 'last_model',
+                 'stats_lock')
 
     def __init__(self, session_id: str, config: ChatGPTConfig, create_now=True):
         """A ChatGPTProxy is represent to a session of MultiChatGPT.
@@ -213,7 +488,15 @@ class ChatGPTProxy(ChatGPT):
         self.initial_response = ""
 
         self.create_at = 0
-        self.touch_at = 0
+        self.touch_at = time.time()  # not a zombie until idle for a while
+
+        # stats: updated by ask() & admit() (may be on different threads)
+        self.stats_lock = threading.Lock()
+        self.requests = 0  # asks sent
+        self.rejected = 0  # asks rate limited before sent
+        self.last_latency = 0.0  # of the last ask sent
+        self.tokens = 0
+        self.last_model = ""
 
         if create_now:
             self.renew()
@@ -251,31 +534,135 @@ class ChatGPTProxy(ChatGPT):
                     f"ChatGPTProxy._new_chatgpt failed to get initial_response: {e}")
         return new_chatgpt
 
+    def admit(self):
+        """admission of the next ask (ChatGPTv3.admit), None if not rate limited
+
+        Raises:
+            CooldownException: rate limited
+        """
+        admit = getattr(self.chatgpt, 'admit', None)
+        if admit is None:
+            return None
+        try:
+            return admit()
+        except CooldownException:
+            self.touch_at = time.time()
+            with self.stats_lock:
+                self.rejected += 1
+            raise
+
+    def _route(self, prompt: str, kwargs: dict) -> str | None:
+        """V3: pick the model of this ask (v3_router) into kwargs"""
+        if self.config.version != APIVersion.V3:
+            return None
+        model = kwargs['model'] = v3_router.route(prompt, self.config.tier)
+        self.last_model = model
+        return model
+
+    def _done(self, start: float, model: str | None, tokens: int, error: BaseException | None):
+        if isinstance(error, CooldownException):
+            with self.stats_lock:
+                self.rejected += 1
+            if model:
+                v3_router.release(model)  # not sent: no stats
+            return
+        with self.stats_lock:
+            self.requests += 1
+            self.tokens += tokens
+            self.last_latency = time.time() - start
+        if not model:
+            return
+        if isinstance(error, GeneratorExit):
+            v3_router.release(model)  # not to the end: no latency
+        else:
+            # the upstream latency: the ask may have waited for the TPM budget
+            latency = getattr(self.chatgpt, 'last_latency', self.last_latency)
+            v3_router.observe(model, latency, tokens, ok=error is None)
+
     def ask(self, session_id, prompt, **kwargs):
-        """ask the underlying (real) ChatGPT"""
-        self.touch_at = time.time()
-        return self.chatgpt.ask(session_id, prompt, **kwargs)
+        """ask the underlying (real) ChatGPT, with the model routed by v3_router"""
+        self.touch_at = start = time.time()
+        chatgpt = self.chatgpt
+        model = self._route(prompt, kwargs)
+        tokens, error = 0, None
+        try:
+            resp = chatgpt.ask(session_id, prompt, **kwargs)
+            tokens = getattr(chatgpt, 'last_usage', 0)
+            return resp
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self._done(start, model, tokens, error)
+
+    def ask_stream(self, session_id, prompt, **kwargs) -> Iterator[str]:
+        """ask the underlying (real) ChatGPT, streaming sentences"""
+        self.touch_at = start = time.time()
+        chatgpt = self.chatgpt
+        model = self._route(prompt, kwargs)
+        tokens, error = 0, None
+        try:
+            yield from chatgpt.ask_stream(session_id, prompt, **kwargs)
+            tokens = getattr(chatgpt, 'last_usage', 0)
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self._done(start, model, tokens, error)
+
+    def stats(self, zombie_timeout=1800, queue_depth=0) -> SessionStats:
+        with self.stats_lock:  # requests, tokens & rejected of the same asks
+            return SessionStats(
+                session_id=self.session_id,
+                create_at=self.create_at,
+                touch_at=self.touch_at,
+                history_size=len(getattr(self.chatgpt, 'history', ())),
+                zombie=self.is_zombie(timeout=zombie_timeout),
+                requests=self.requests,
+                rejected=self.rejected,
+                last_latency=self.last_latency,
+                tokens=self.tokens,
+                queue_depth=queue_depth,
+                tier=self.config.tier,
+                model=self.last_model)
 
 
 # MultiChatGPT: {session_id: ChatGPT}:
 #  - new(config) -> session_id
 #  - ask(session_id, prompt) -> response
 #  - delete(session_id)
+#  - submit_*(...) -> Future: the same, queued per session (self.dispatcher)
 class MultiChatGPT(ChatGPT):
     """MultiChatGPT: {session_id: ChatGPT}"""
 
-    def __init__(self):
-        self.chatgpts: Dict[str, ChatGPTProxy] = {}  # XXX: 话说这东西线程安全嘛
+    def __init__(self, workers=10, max_queued=10, max_session_queue=4):
+        self.chatgpts: Dict[str, ChatGPTProxy] = {}
+        self.lock = threading.Lock()  # for adding / removing self.chatgpts
+
+        # asks of a session run one after another, on workers shared by all
+        # sessions: a waiting ask costs no thread (and no ChatGPTv3.lock wait)
+        self.dispatcher = Dispatcher(workers, max_queued, max_session_queue)
 
         self.timeout = 900  # timeout in seconds: 15 min
         self.check_timeout_interval = 60  # interval time to check timeout session in sec
 
-        Timer(self.check_timeout_interval, self.renew_timeout_sessions).start()
+        self._schedule_renew()
+
+    def _schedule_renew(self):
+        # daemon: do not keep the process alive after the server stops
+        timer = Timer(self.check_timeout_interval, self.renew_timeout_sessions)
+        timer.daemon = True
+        timer.start()
+
+    def sessions(self) -> List[ChatGPTProxy]:
+        """a snapshot of the sessions: safe to iterate while sessions come and go"""
+        with self.lock:
+            return list(self.chatgpts.values())
 
     def renew_timeout_sessions(self):
         try:
             now = time.time()
-            for chatgpt in self.chatgpts.values():
+            for chatgpt in self.sessions():
                 if chatgpt.is_zombie(timeout=self.timeout*2):
                     logging.debug(f"MultiChatGPT: zombie chatgpt: {chatgpt.session_id}, skip renew.")
                     continue
@@ -285,12 +672,12 @@ class MultiChatGPT(ChatGPT):
         except Exception as e:
             logging.error(f"MultiChatGPT: renew_timeout_sessions error: {e}")
         finally:
-            Timer(self.check_timeout_interval, self.renew_timeout_sessions).start()
+            self._schedule_renew()
 
     def clean_zombie_sessions(self):
         try:
             session_ids_to_del = []
-            for chatgpt in self.chatgpts.values():
+            for chatgpt in self.sessions():
                 if chatgpt.is_zombie(timeout=self.timeout*2):
                     session_ids_to_del.append(chatgpt.session_id)
             logging.info(f"MultiChatGPT: delete zombie chatgpts: {session_ids_to_del}")
@@ -316,11 +703,18 @@ class MultiChatGPT(ChatGPT):
 
         session_id = str(uuid.uuid4())
 
-        self.chatgpts[session_id] = ChatGPTProxy(
-                session_id, config, create_now=True)
+        chatgpt = ChatGPTProxy(session_id, config, create_now=True)
+        with self.lock:
+            self.chatgpts[session_id] = chatgpt
 
         return session_id
 
+    def _get(self, session_id: str) -> ChatGPTProxy:
+        chatgpt = self.chatgpts.get(session_id)
+        if chatgpt is None:
+            raise SessionNotFound(session_id)
+        return chatgpt
+
     def ask(self, session_id: str, prompt: str, **kwargs) -> str:  # raises ChatGPTError
         """Ask ChatGPT with session_id and prompt, return response text
 
@@ -328,23 +722,93 @@ class MultiChatGPT(ChatGPT):
             SessionNotFound: Session not found
             ChatGPTError: ChatGPT error when asking
         """
-        if session_id not in self.chatgpts:
-            raise SessionNotFound(session_id)
+        chatgpt = self._get(session_id)
 
-        resp = self.chatgpts[session_id].ask(session_id, prompt)
+        resp = chatgpt.ask(session_id, prompt)
 
         return resp
 
+    def ask_stream(self, session_id: str, prompt: str, **kwargs) -> Iterator[str]:
+        """Ask ChatGPT with session_id and prompt, yield the response in sentences
+
+        Raises:
+            SessionNotFound: Session not found
+            ChatGPTError: ChatGPT error when asking
+        """
+        chatgpt = self._get(session_id)
+
+        yield from chatgpt.ask_stream(session_id, prompt)
+
+    def submit_new_session(self, config: ChatGPTConfig) -> Future:
+        """new_session() on a dispatcher worker: a Future of the session_id
+
+        Raises:
+            Overloaded: too many calls waiting
+        """
+        return self.dispatcher.submit(None, self.new_session, config)
+
+    def submit_ask(self, session_id: str, prompt: str) -> Future:
+        """ask() queued after the earlier asks of the session: a Future of the
+        response text (or the ask's ChatGPTError, CooldownException).
+
+        Cancel the Future to drop the ask if it has not started.
+
+        Raises:
+            SessionNotFound: Session not found
+            SessionQueueFull: too many asks of the session waiting or running
+            Overloaded: too many calls waiting
+        """
+        chatgpt = self._get(session_id)
+        # admitted when next of the session: a delay for the TPM budget is
+        # spent on the dispatcher's timer, not on a worker
+        return self.dispatcher.submit(session_id, chatgpt.ask, session_id, prompt,
+                                      admit=chatgpt.admit)
+
+    def submit_ask_stream(self, session_id: str, prompt: str,
+                          on_sentence: Callable[[str], bool]) -> Future:
+        """ask_stream() queued like submit_ask(). The worker calls
+        on_sentence(sentence) for each sentence: return False to stop the ask.
+
+        The Future: the number of sentences (or the ask's exception).
+
+        Raises:
+            SessionNotFound, SessionQueueFull, Overloaded: as submit_ask()
+        """
+        chatgpt = self._get(session_id)
+
+        def run(admission=None) -> int:
+            sentences = 0
+            stream = chatgpt.ask_stream(session_id, prompt, admission=admission)
+            try:
+                for sentence in stream:
+                    sentences += 1
+                    if on_sentence(sentence) is False:
+                        break
+            finally:
+                stream.close()
+            return sentences
+
+        return self.dispatcher.submit(session_id, run, admit=chatgpt.admit)
+
     def delete(self, session_id: str):  # raises SessionNotFound
         """Delete ChatGPT session
 
         Raises:
             SessionNotFound: Session not found
         """
-        if session_id not in self.chatgpts:
-            raise SessionNotFound(session_id)
-
-        del self.chatgpts[session_id]
+        with self.lock:
+            if session_id not in self.chatgpts:
+                raise SessionNotFound(session_id)
+
+            del self.chatgpts[session_id]
+
+    def session_stats(self) -> List[SessionStats]:
+        """SessionStats of all sessions, ordered by session_id"""
+        stats = [s.stats(zombie_timeout=self.timeout*2,
+                         queue_depth=self.dispatcher.depth(s.session_id))
+                 for s in self.sessions()]
+        stats.sort(key=lambda s: s.session_id)
+        return stats
 
 
 # Exceptions: TooManySessions, SessionNotFound, ChatGPTError
@@ -1,5 +1,13 @@
 import logging
+import math
+import re
+import threading
+import time
+from dataclasses import dataclass
 from datetime import datetime
+from typing import Dict
+
+from eventlog import log_event
 
 
 def cooldown(seconds: int):
@@ -32,3 +40,248 @@ def cooldown(seconds: int):
 class CooldownException(Exception):
     def __init__(self, seconds: int):
         super().__init__(f"Cooldown: {seconds} seconds")
+
+
+def mask_key(key: str) -> str:
+    """sk-abcdefghijkl -> sk-ab***ijkl: safe to log & expose"""
+    if len(key) <= 10:
+        return "***"
+    return key[:5] + "***" + key[-4:]
+
+
+def parse_duration(s) -> float:
+    """Parse rate-limit reset values: "20ms", "1s", "6m0s", "1h2m3.5s" or plain seconds.
+
+    Returns seconds, or 0 if unparsable.
+    """
+    if s is None:
+        return 0
+    try:
+        return float(s)
+    except ValueError:
+        pass
+    seconds = 0.0
+    for value, unit in re.findall(r"([\d.]+)(ms|h|m|s)", str(s)):
+        seconds += float(value) * {"ms": 0.001, "s": 1, "m": 60, "h": 3600}[unit]
+    return seconds
+
+
+@dataclass
+class _KeyState:
+    interval: float         # current cooldown (seconds between requests)
+    last_called: float = 0
+    blocked_until: float = 0  # set by Retry-After / reset headers
+
+
+class AdaptiveCooldown:
+    """AdaptiveCooldown: a per-key cooldown that learns from upstream rate-limit signals.
+
+    Each key (api_key) starts at `seconds` between requests. observe() feeds
+    the upstream response back:
+
+    - 429: the interval is multiplied by `slowdown` (fast cut) and the key is
+      blocked for Retry-After (or the reset header) seconds;
+    - 2xx with x-ratelimit-remaining-requests above `headroom` of the limit:
+      the interval is multiplied by `speedup` (cautious raise);
+    - 2xx with no remaining requests: the key is blocked until the reset.
+
+    The interval stays within [min_seconds, max_seconds] and never goes below
+    the advertised x-ratelimit-limit-requests (per minute).
+    """
+
+    def __init__(self, seconds: float, min_seconds: float, max_seconds: float,
+                 speedup: float = 0.95, slowdown: float = 2.0, headroom: float = 0.2):
+        self.seconds = seconds
+        self.min_seconds = min_seconds
+        self.max_seconds = max_seconds
+        self.speedup = speedup
+        self.slowdown = slowdown
+        self.headroom = headroom
+
+        self._keys: Dict[str, _KeyState] = {}
+        self._lock = threading.Lock()
+
+    def _state(self, key: str) -> _KeyState:
+        state = self._keys.get(key)
+        if state is None:
+            state = self._keys.setdefault(key, _KeyState(interval=self.seconds))
+        return state
+
+    def acquire(self, key: str, at: float = 0):
+        """Take a request slot for key, for a request sent at `at` (unix time,
+        default: now).
+
+        Raises:
+            CooldownException: key is cooling down or blocked by upstream
+        """
+        with self._lock:
+            state = self._state(key)
+            now = time.time()
+            at = max(at, now)
+            ready_at = max(state.last_called + state.interval, state.blocked_until)
+            if at < ready_at:
+                raise CooldownException(math.ceil(ready_at - now))
+            state.last_called = at
+
+    def check(self, key: str):
+        """Like acquire(), without taking the slot: to reject before waiting for
+        something else (e.g. TokenBudget).
+
+        Raises:
+            CooldownException: key is cooling down or blocked by upstream
+        """
+        with self._lock:
+            state = self._state(key)
+            now = time.time()
+            ready_at = max(state.last_called + state.interval, state.blocked_until)
+            if now < ready_at:
+                raise CooldownException(math.ceil(ready_at - now))
+
+    def observe(self, key: str, status_code: int, headers):
+        """Adjust the key's rate from an upstream response (status & headers)."""
+        limit = _int_header(headers, "x-ratelimit-limit-requests")
+        remaining = _int_header(headers, "x-ratelimit-remaining-requests")
+        reset = parse_duration(headers.get("x-ratelimit-reset-requests"))
+
+        with self._lock:
+            state = self._state(key)
+            old = state.interval
+            now = time.time()
+            floor = self.min_seconds
+            if limit:
+                floor = max(floor, 60 / limit)
+
+            if status_code == 429:
+                retry_after = parse_duration(headers.get("retry-after")) or reset
+                state.interval = old * self.slowdown
+                state.blocked_until = max(state.blocked_until,
+                                          now + (retry_after or state.interval))
+            elif 200 <= status_code < 300:
+                if remaining == 0:
+                    state.blocked_until = max(state.blocked_until, now + reset)
+                elif remaining is not None and limit and remaining / limit > self.headroom:
+                    state.interval = old * self.speedup
+
+            state.interval = min(max(state.interval, floor), self.max_seconds)
+
+            if state.interval != old:
+                log_event(logging.DEBUG, 'AdaptiveCooldown.interval',
+                          key=mask_key(key), old=old, new=state.interval,
+                          status=status_code, remaining=remaining, limit=limit)
+
+    def rate(self, key: str) -> float:
+        """Current effective rate of key, in requests per minute."""
+        with self._lock:
+            return 60 / self._state(key).interval
+
+    def rates(self) -> Dict[str, float]:
+        """{masked key: requests per minute} of all keys seen."""
+        with self._lock:
+            return {mask_key(k): 60 / s.interval for k, s in self._keys.items()}
+
+
+def _int_header(headers, name: str):
+    try:
+        return int(headers.get(name))
+    except (TypeError, ValueError):
+        return None
+
+
+@dataclass
+class _Bucket:
+    capacity: float   # tokens per minute
+    tokens: float     # may go negative: reserved ahead of the refill
+    updated_at: float
+    pending: float = 0  # reserved for requests not sent yet: not in upstream's remaining
+
+
+class TokenBudget:
+    """TokenBudget: per-key tokens-per-minute (TPM) admission control.
+
+    A token bucket per key (api_key), refilled at capacity/60 per second.
+    reserve() takes the tokens a request counts before it is sent.
+    If the bucket is short, the request is scheduled: the tokens are taken
+    ahead (the bucket goes negative) and reserve() returns the time they are
+    refilled, in arrival order, for the caller to send the request then. If
+    that would take longer than max_wait, CooldownException is raised instead.
+
+    Once the request is sent, commit() leaves the tokens to upstream: it
+    counts them (max_tokens, used or not), so they are not given back. A
+    request dropped before sent release()s them. observe() syncs the bucket
+    with the x-ratelimit-*-tokens upstream headers, less the tokens reserved
+    for requests not sent yet.
+    """
+
+    def __init__(self, tpm: int, max_wait: float):
+        self.tpm = tpm
+        self.max_wait = max_wait
+
+        self._keys: Dict[str, _Bucket] = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, key: str, now: float) -> _Bucket:
+        b = self._keys.get(key)
+        if b is None:
+            b = self._keys.setdefault(key, _Bucket(self.tpm, self.tpm, now))
+        b.tokens = min(b.capacity, b.tokens + (now - b.updated_at) * b.capacity / 60)
+        b.updated_at = now
+        return b
+
+    def reserve(self, key: str, tokens: int, max_wait: float | None = None) -> float:
+        """Reserve tokens for a request with key, up to max_wait (default:
+        self.max_wait) ahead. max_wait=0: now or never.
+
+        Returns the unix time the request may be sent (now, or up to max_wait later).
+
+        Raises:
+            CooldownException: the budget would not allow it within max_wait
+        """
+        if max_wait is None:
+            max_wait = self.max_wait
+        with self._lock:
+            now = time.time()
+            b = self._bucket(key, now)
+            tokens = min(tokens, b.capacity)  # or it would never fit
+            wait = max(0, (tokens - b.tokens) * 60 / b.capacity)
+            if wait > max_wait:
+                raise CooldownException(math.ceil(wait))
+            b.tokens -= tokens
+            b.pending += tokens
+
+        if wait > 0:
+            log_event(logging.DEBUG, 'TokenBudget.wait',
+                      key=mask_key(key), wait=wait, tokens=tokens)
+        return now + wait
+
+    def commit(self, key: str, tokens: int):
+        """The request tokens were reserved for is sent: upstream counts them now."""
+        with self._lock:
+            b = self._bucket(key, time.time())
+            b.pending = max(0, b.pending - tokens)
+
+    def release(self, key: str, tokens: int):
+        """Give back the tokens reserved for a request that is not sent."""
+        with self._lock:
+            b = self._bucket(key, time.time())
+            tokens = min(tokens, b.pending)
+            b.pending -= tokens
+            b.tokens = min(b.capacity, b.tokens + tokens)
+
+    def observe(self, key: str, headers):
+        """Sync the key's bucket with the upstream x-ratelimit-*-tokens headers."""
+        limit = _int_header(headers, "x-ratelimit-limit-tokens")
+        remaining = _int_header(headers, "x-ratelimit-remaining-tokens")
+        with self._lock:
+            b = self._bucket(key, time.time())
+            if limit:
+                b.capacity = limit
+            if remaining is not None:
+                b.tokens = min(b.tokens, remaining - b.pending)
+
+    def budgets(self) -> Dict[str, Dict[str, float]]:
+        """{masked key: {"capacity": tpm, "remaining": tokens}} of all keys seen."""
+        with self._lock:
+            now = time.time()
+            return {mask_key(k): {"capacity": b.capacity,
+                                  "remaining": self._bucket(k, now).tokens}
+                    for k, b in list(self._keys.items())}
@@ -0,0 +1,242 @@
+import heapq
+import itertools
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict, Hashable, List, Optional, Set, Tuple
+
+
+@dataclass(eq=False)  # queued calls are compared by identity
+class _Work:
+    fn: Callable
+    args: tuple
+    admit: Optional[Callable[[], Any]] = None
+    admission: Any = None  # admit()'s result
+    delayed: bool = False  # on a timer until admission.ready_at
+    future: Future = field(default_factory=Future)
+
+
+class Dispatcher:
+    """Dispatcher runs calls queued per session on a few shared worker threads.
+
+    - calls of a session run one at a time, in the order submitted;
+    - calls of different sessions run concurrently, on at most `workers` threads;
+    - a waiting call is an entry in its session's queue, not a blocked thread.
+
+    Sessions take turns: a worker runs one call of a session, then puts the
+    session back behind the others waiting for a worker.
+
+    submit() rejects at once, instead of letting calls pile up:
+    SessionQueueFull when the session already has max_depth calls waiting or
+    running, Overloaded when max_queued calls are waiting in all.
+
+    A call may be admitted first (rate limits): admit() is called when the
+    call is next of its session, and may return an admission to send it
+    later, at admission.ready_at. Until then the call waits at the head of
+    its session queue, on a timer instead of a worker.
+    """
+
+    def __init__(self, workers: int, max_queued: int, max_depth: int):
+        self.workers = workers
+        self.max_queued = max_queued
+        self.max_depth = max_depth
+
+        self.in_flight = 0
+        self.queued = 0
+        self.latency = 1.0  # EWMA of the seconds a call runs
+
+        self._queues: Dict[Hashable, Deque[_Work]] = {}  # waiting calls
+        self._heads: Dict[Hashable, _Work] = {}  # next calls, being admitted or delayed
+        self._running: Set[Hashable] = set()
+        self._scheduled: Set[Hashable] = set()  # running, delayed, or waiting for a worker
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='dispatcher')
+        self._lock = threading.Lock()
+
+        self._timers: List[Tuple[float, int, Hashable, _Work]] = []  # heap of (ready_at, seq, key, work)
+        self._seq = itertools.count()  # keys are not comparable
+        self._timer_cond = threading.Condition(self._lock)
+        self._closed = False
+        threading.Thread(target=self._run_timers, name='dispatcher-timer', daemon=True).start()
+
+    def retry_after(self) -> int:
+        """seconds until a new call would likely start"""
+        return max(1, math.ceil(self.latency * (self.queued + 1) / self.workers))
+
+    def depth(self, key: Hashable) -> int:
+        """calls of session key waiting or running"""
+        return len(self._queues.get(key, ())) + (key in self._heads) + (key in self._running)
+
+    def submit(self, key: Hashable, fn: Callable, *args,
+               admit: Optional[Callable[[], Any]] = None) -> Future:
+        """Queue fn(*args) after the calls submitted before with the same key
+        (session_id). key None: a call of its own, not ordered with any other.
+
+        admit: called when the call is next of key. Its result is passed to
+        fn as admission=..., and if it has a ready_at (unix time) in the
+        future, fn is run then; if admit raises, the Future gets the exception
+        and fn is not run. An admission of a call cancelled before it runs is
+        given back by its cancel().
+
+        Returns the Future of fn's result. Cancel it to drop the call if it
+        has not started.
+
+        Raises:
+            SessionQueueFull: max_depth calls of key are waiting or running
+            Overloaded: max_queued calls are waiting
+        """
+        key = object() if key is None else key
+        work = _Work(fn, args, admit)
+        with self._lock:
+            if self.depth(key) >= self.max_depth:
+                raise SessionQueueFull(key, self.max_depth)
+            if self.queued >= self.max_queued:
+                raise Overloaded(self.retry_after())
+            self._queues.setdefault(key, deque()).append(work)
+            self.queued += 1
+            if key not in self._scheduled:
+                self._scheduled.add(key)
+                self._pool.submit(self._run, key)
+        work.future.add_done_callback(lambda f: self._cancelled(key, work))
+        return work.future
+
+    def _cancelled(self, key: Hashable, work: _Work):
+        """drop a call cancelled while waiting, give back its admission"""
+        if not work.future.cancelled():
+            return
+        with self._lock:
+            if self._heads.get(key) is work:
+                del self._heads[key]
+                if work.delayed and not self._closed:
+                    self._pool.submit(self._run, key)  # the next call, without the timer
+            else:
+                q = self._queues.get(key)
+                if q is None or work not in q:
+                    return  # dropped by _run
+                q.remove(work)
+            self.queued -= 1
+        if work.admission is not None:
+            work.admission.cancel()
+
+    def _next(self, key: Hashable) -> Optional[_Work]:
+        """the call of key to admit or run next (in self._heads), with the lock held"""
+        work = self._heads.get(key)
+        if work is None and self._queues.get(key):
+            work = self._heads[key] = self._queues[key].popleft()
+        return work
+
+    def _admit(self, key: Hashable, work: _Work) -> Optional[bool]:
+        """admit work (the head of key): True to run it now, False if it is
+        dropped, None if it is delayed (_run_timers reschedules key)"""
+        try:
+            admission = work.admit()
+        except BaseException as e:
+            with self._lock:
+                if self._heads.get(key) is not work:
+                    return False  # cancelled meanwhile
+                del self._heads[key]
+                self.queued -= 1
+            if work.future.set_running_or_notify_cancel():
+                work.future.set_exception(e)
+            return False
+
+        with self._lock:
+            if self._heads.get(key) is work:
+                work.admission = admission
+                ready_at = getattr(admission, 'ready_at', 0)
+                if ready_at <= time.time():
+                    return True
+                work.delayed = True
+                heapq.heappush(self._timers, (ready_at, next(self._seq), key, work))
+                self._timer_cond.notify()
+                return None
+        if admission is not None:  # cancelled meanwhile
+            admission.cancel()
+        return False
+
+    def _run(self, key: Hashable):
+        """run the next call of key (on a worker), then reschedule key if it has more"""
+        while True:
+            with self._lock:
+                work = self._next(key)
+                if work is None:
+                    self._done(key)
+                    return
+            if work.admit is not None and work.admission is None:
+                admitted = self._admit(key, work)
+                if admitted is None:
+                    return  # delayed
+                if not admitted:
+                    continue
+            with self._lock:
+                if self._heads.get(key) is not work:
+                    continue  # cancelled meanwhile
+                del self._heads[key]
+                self.queued -= 1
+                if work.future.set_running_or_notify_cancel():
+                    self._running.add(key)
+                    self.in_flight += 1
+                    break
+            if work.admission is not None:  # cancelled, before _cancelled got the lock
+                work.admission.cancel()
+
+        start = time.time()
+        try:
+            kwargs = {'admission': work.admission} if work.admit is not None else {}
+            work.future.set_result(work.fn(*work.args, **kwargs))
+        except BaseException as e:
+            work.future.set_exception(e)
+
+        with self._lock:
+            self.in_flight -= 1
+            self.latency = 0.8 * self.latency + 0.2 * (time.time() - start)
+            self._running.discard(key)
+            if self._queues.get(key):
+                self._pool.submit(self._run, key)  # behind the other sessions
+            else:
+                self._done(key)
+
+    def _done(self, key: Hashable):
+        self._queues.pop(key, None)
+        self._scheduled.discard(key)
+
+    def _run_timers(self):
+        """put delayed keys back to the workers when their calls are ready"""
+        with self._lock:
+            while not self._closed:
+                now = time.time()
+                while self._timers and self._timers[0][0] <= now:
+                    _, _, key, work = heapq.heappop(self._timers)
+                    if self._heads.get(key) is work:  # or cancelled: rescheduled by _cancelled
+                        work.delayed = False
+                        self._pool.submit(self._run, key)
+                timeout = self._timers[0][0] - now if self._timers else None
+                self._timer_cond.wait(timeout)
+
+    def shutdown(self):
+        """Drop the waiting calls, let the running ones finish (in the background)."""
+        with self._lock:
+            self._closed = True
+            self._timer_cond.notify()
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        with self._lock:
+            works = [w for q in self._queues.values() for w in q] + list(self._heads.values())
+        for w in works:
+            w.future.cancel()
+
+
+class Overloaded(Exception):
+    def __init__(self, retry_after: int):
+        self.retry_after = retry_after
+        self.message = f"Server overloaded, retry after {retry_after} seconds"
+        super().__init__(self.message)
+
+
+class SessionQueueFull(Exception):
+    def __init__(self, session_id, max_depth: int):
+        self.session_id = session_id
+        self.max_depth = max_depth
+        self.message = f"Session {session_id} busy: {max_depth} calls waiting or running"
+        super().__init__(self.message)
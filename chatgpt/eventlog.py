@@ -0,0 +1,173 @@
+"""
+eventlog: structured, sampled logging that stays off the request thread.
+
+    log_event(logging.INFO, "Chat.ok", request_id=rid, session_id=sid, response=resp)
+
+The record is put on a queue as-is and formatted by a background listener
+thread (setup_logging), so the caller pays neither the string formatting
+nor the I/O. Events below WARNING are sampled per event name, and bodies
+(prompt/response) are truncated when formatted.
+
+Environment variables:
+
+CHATGPT_LOG_FORMAT:   "text" or "json" (default: text)
+CHATGPT_LOG_SAMPLING: per-event sample rates for events below WARNING,
+                      e.g. "Chat.ok=0.1,NewSession.ok=1" (default: all 1)
+CHATGPT_LOG_MAX_BODY: max characters of a logged prompt/response body,
+                      0 to omit bodies (default: 200)
+"""
+
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import random
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict
+
+# fields holding user/model text: truncated to LOG_MAX_BODY when formatted
+BODY_FIELDS = ("prompt", "response", "initial_prompt", "initial_response")
+
+
+def _parse_sampling(s: str) -> Dict[str, float]:
+    """"Chat.ok=0.1,NewSession.ok=1" -> {"Chat.ok": 0.1, "NewSession.ok": 1.0}"""
+    rates = {}
+    for item in s.split(","):
+        if not item.strip():
+            continue
+        try:
+            event, rate = item.split("=")
+            rates[event.strip()] = float(rate)
+        except ValueError:
+            logging.warning(f"eventlog: bad CHATGPT_LOG_SAMPLING item: {item!r}")
+    return rates
+
+
+LOG_FORMAT = os.getenv("CHATGPT_LOG_FORMAT", "text")
+LOG_SAMPLING = _parse_sampling(os.getenv("CHATGPT_LOG_SAMPLING", ""))
+LOG_MAX_BODY = int(os.getenv("CHATGPT_LOG_MAX_BODY", 200))
+
+
+def _truncate(value, max_len: int = LOG_MAX_BODY):
+    value = str(value)
+    if len(value) <= max_len:
+        return value
+    return value[:max_len] + f"...({len(value)} chars)"
+
+
+class Event:
+    """Event is a log message: an event name with fields.
+
+    It is formatted lazily (by the listener thread), truncating BODY_FIELDS.
+    """
+    __slots__ = ("event", "fields")
+
+    def __init__(self, event: str, fields: dict):
+        self.event = event
+        self.fields = fields
+
+    def as_dict(self) -> dict:
+        d = {}
+        for k, v in self.fields.items():
+            if k in BODY_FIELDS:
+                if LOG_MAX_BODY <= 0:
+                    continue
+                v = _truncate(v, LOG_MAX_BODY)
+            d[k] = v
+        return d
+
+    def __str__(self):
+        fields = " ".join(f"{k}={v!r}" if isinstance(v, str) else f"{k}={v}"
+                          for k, v in self.as_dict().items())
+        return f"{self.event}: {fields}" if fields else self.event
+
+
+def log_event(level: int, event: str, logger: logging.Logger = None, **fields):
+    """Log an event with fields.
+
+    Events below WARNING are dropped with probability 1 - LOG_SAMPLING[event].
+    """
+    logger = logger or logging.getLogger()
+    if not logger.isEnabledFor(level):
+        return
+    if level < logging.WARNING:
+        rate = LOG_SAMPLING.get(event, 1.0)
+        if rate < 1.0 and random.random() >= rate:
+            return
+    logger.log(level, Event(event, fields))
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line: {ts, level, logger, event|msg, exc, **fields}
+
+    Event fields named like the keys above are prefixed with "field." rather
+    than overwriting them.
+    """
+    RESERVED = ("ts", "level", "logger", "event", "msg", "exc")
+
+    def format(self, record: logging.LogRecord) -> str:
+        d = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+        }
+        if isinstance(record.msg, Event):
+            d["event"] = record.msg.event
+            for k, v in record.msg.as_dict().items():
+                d[f"field.{k}" if k in self.RESERVED else k] = v
+        else:
+            d["msg"] = record.getMessage()
+        if record.exc_info:
+            d["exc"] = self.formatException(record.exc_info)
+        return json.dumps(d, ensure_ascii=False, default=str)
+
+
+class _LazyQueueHandler(QueueHandler):
+    """QueueHandler that leaves the formatting to the listener's handler.
+
+    QueueHandler.prepare() formats the whole record in the emitting thread,
+    traceback included, and drops exc_info: the handler's formatter (e.g.
+    JSONFormatter's "exc") would never see it. The queue is in-process, so
+    records need not be picklable:
+
+    - Event records are queued as they are: their fields are not mutated
+      after logging;
+    - other messages are merged with their args now (the args may change),
+      exc_info is kept for the formatter.
+    """
+
+    def prepare(self, record: logging.LogRecord):
+        if isinstance(record.msg, Event):
+            return record
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def setup_logging(level: int = logging.INFO, fmt: str = LOG_FORMAT):
+    """Route the root logger through a queue to a background stderr handler.
+
+    Replaces logging.basicConfig(). The listener is stopped (and the queue
+    flushed) at exit.
+    """
+    handler = logging.StreamHandler()
+    if fmt == "json":
+        handler.setFormatter(JSONFormatter())
+    else:
+        handler.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+
+    q = queue.SimpleQueue()
+    listener = QueueListener(q, handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+
+    root = logging.getLogger()
+    for h in root.handlers[:]:
+        root.removeHandler(h)
+    root.addHandler(_LazyQueueHandler(q))
+    root.setLevel(level)
+
+    return listener
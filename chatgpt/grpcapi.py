@@ -1,40 +1,160 @@
+import asyncio
+import functools
+import inspect
 import json
 import logging
 import os
-from chatbot import MultiChatGPT, ChatGPTConfig, ChatGPTError, TooManySessions, SessionNotFound, APIVersion
+import signal
+import threading
+import time
+import uuid
+from chatbot import MultiChatGPT, ChatGPTConfig, ChatGPTError, TooManySessions, SessionNotFound, APIVersion, v3_cooldown, v3_token_budget, v3_router
 from cooldown import CooldownException
+from dispatcher import Overloaded, SessionQueueFull
+from eventlog import log_event
+from recorder import TraceRecorder
 from protos import chatbot_pb2, chatbot_pb2_grpc
 
 import grpc
-from concurrent import futures
+
+
+def _request_id(context) -> str:
+    """x-request-id from the invocation metadata, or a new one"""
+    for key, value in context.invocation_metadata() or ():
+        if key == 'x-request-id':
+            return value
+    return uuid.uuid4().hex[:16]
+
+
+# Dispatcher (MultiChatGPT): at most GRPC_MAX_IN_FLIGHT calls to ChatGPT at
+# a time, GRPC_MAX_QUEUED more waiting for them, and GRPC_MAX_SESSION_QUEUE
+# calls of a session waiting or running. Beyond that: RESOURCE_EXHAUSTED.
+MAX_IN_FLIGHT = int(os.getenv('GRPC_MAX_IN_FLIGHT', 10))
+MAX_QUEUED = int(os.getenv('GRPC_MAX_QUEUED', 10))
+MAX_SESSION_QUEUE = int(os.getenv('GRPC_MAX_SESSION_QUEUE', 4))
+# SIGTERM: seconds for in-flight calls to finish
+DRAIN_GRACE = float(os.getenv('GRPC_DRAIN_GRACE', 30))
+
+
+_STATUS_CODES = {c.value[0]: c for c in grpc.StatusCode}
+
+
+def _code(context) -> grpc.StatusCode | None:
+    """the status code set on context: grpc.aio gives it as an int"""
+    code = context.code()
+    return _STATUS_CODES.get(code, code) if isinstance(code, int) else code
+
+
+def _set_overloaded(context, e: Overloaded):
+    context.set_code(grpc.StatusCode.RESOURCE_EXHAUSTED)
+    context.set_details(str(e))
+    context.set_trailing_metadata((('retry-after', str(e.retry_after)),))
+
+
+def _set_busy(context, e: SessionQueueFull):
+    context.set_code(grpc.StatusCode.RESOURCE_EXHAUSTED)
+    context.set_details(str(e))
+
+
+def _trace_fields(rpc: str, request, response) -> dict:
+    """fields of a TraceRecorder.record() for the rpc"""
+    if rpc == 'NewSession':
+        fields = {'session_id': response.session_id if response else '',
+                  'prompt': request.initial_prompt}
+        try:
+            c = json.loads(request.config)
+            fields['v'] = c.get('version', None)
+            fields['key'] = TraceRecorder.key_hash(
+                c.get('access_token', False) or c.get('api_key', False) or '')
+        except Exception:
+            pass
+        return fields
+    if rpc == 'DeleteSession':
+        return {'session_id': request.session_id}
+    return {'session_id': request.session_id, 'prompt': request.prompt}
+
+
+def _recorded(handler):
+    """Record the RPCs of handler to self.recorder, if any."""
+    rpc = handler.__name__
+
+    if inspect.isasyncgenfunction(handler):
+        @functools.wraps(handler)
+        async def stream_wrapper(self, request, context):
+            arrival = time.time()
+            try:
+                async for response in handler(self, request, context):
+                    yield response
+            finally:
+                if self.recorder is not None:
+                    self.recorder.record(rpc, arrival, _code(context),
+                                         **_trace_fields(rpc, request, None))
+        return stream_wrapper
+
+    @functools.wraps(handler)
+    async def wrapper(self, request, context):
+        if self.recorder is None:
+            return await handler(self, request, context)
+        arrival = time.time()
+        response, code = None, None
+        try:
+            response = await handler(self, request, context)
+            code = _code(context)
+            return response
+        except asyncio.CancelledError:
+            code = grpc.StatusCode.CANCELLED
+            raise
+        except Exception:
+            code = grpc.StatusCode.UNKNOWN  # what grpc answers for a raising handler
+            raise
+        finally:
+            self.recorder.record(rpc, arrival, code,
+                                 **_trace_fields(rpc, request, response))
+    return wrapper
 
 
 class ChatGPTgRPCServer(chatbot_pb2_grpc.ChatbotServiceServicer):
-    def __init__(self):
-        self.multiChatGPT = MultiChatGPT()
+    def __init__(self, recorder: TraceRecorder | None = None):
+        self.multiChatGPT = MultiChatGPT(workers=MAX_IN_FLIGHT, max_queued=MAX_QUEUED,
+                                         max_session_queue=MAX_SESSION_QUEUE)
+        self.draining = False  # SIGTERM: no more new sessions
+        self.recorder = recorder  # traffic trace for replay.py: opt-in
 
-    def NewSession(self, request, context):
+    @_recorded
+    async def NewSession(self, request, context):
         """NewSession creates a new session with ChatGPT.
         Input: access_token (string) and initial_prompt (string).
         Output: session_id (string).
         """
+        request_id = _request_id(context)
+        if self.draining:
+            context.set_code(grpc.StatusCode.UNAVAILABLE)
+            context.set_details('server is draining')
+            log_event(logging.WARNING, 'NewSession.error', request_id=request_id,
+                      code='UNAVAILABLE', details='server is draining')
+            return chatbot_pb2.NewSessionResponse()
+
         try:
             c = request.config
             c = json.loads(c)
+            config = ChatGPTConfig(
+                version=APIVersion(c.get('version', None)),
+                access_token=c.get('access_token', False) or c.get('api_key', False) or '',
+                initial_prompt=request.initial_prompt,
+                tier=str(c.get('tier', None) or ''))
         except Exception as e:
             context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
             context.set_details(str(e))
-            logging.warning('ChatGPTgRPCServer.NewSession: bad config')
+            log_event(logging.WARNING, 'NewSession.bad_config',
+                      request_id=request_id, error=str(e))
             return chatbot_pb2.NewSessionResponse()
 
-        config = ChatGPTConfig(
-            version=APIVersion(c.get('version', None)),
-            access_token=c.get('access_token', False) or c.get('api_key', False) or '',
-            initial_prompt=request.initial_prompt)
-
         session_id = None
         try:
-            session_id = self.multiChatGPT.new_session(config)
+            session_id = await asyncio.wrap_future(
+                self.multiChatGPT.submit_new_session(config))
+        except Overloaded as e:
+            _set_overloaded(context, e)
         except TooManySessions as e:
             context.set_code(grpc.StatusCode.RESOURCE_EXHAUSTED)
             context.set_details(str(e))
@@ -42,38 +162,53 @@ class ChatGPTgRPCServer(chatbot_pb2_grpc.ChatbotServiceServicer):
             context.set_code(grpc.StatusCode.UNAVAILABLE)
             context.set_details(str(e))
 
-        if context.code() != grpc.StatusCode.OK and context.code() != None:
-            logging.warn(
-                f'ChatGPTgRPCServer.NewSession: {context.code()}: {context.details()}')
+        if _code(context) != grpc.StatusCode.OK and _code(context) != None:
+            log_event(logging.WARNING, 'NewSession.error',
+                      request_id=request_id, code=_code(context).name,
+                      details=context.details())
         else:
-            logging.info(
-                f'ChatGPTgRPCServer.NewSession: (OK) session_id={session_id}')
+            log_event(logging.INFO, 'NewSession.ok',
+                      request_id=request_id, session_id=session_id,
+                      initial_prompt=request.initial_prompt)
+
+        if session_id is None:
+            return chatbot_pb2.NewSessionResponse()
 
         # TODO: 这个 initial_response 太恶心了，还是逐层传比较好吧
         return chatbot_pb2.NewSessionResponse(session_id=session_id, initial_response=self.multiChatGPT.chatgpts[session_id].initial_response)
 
-    def Chat(self, request, context):
+    @_recorded
+    async def Chat(self, request, context):
         """Chat sends a prompt to ChatGPT and receives a response.
         Input: session_id (string) and prompt (string).
         Output: response (string).
         """
+        request_id = _request_id(context)
         if not request.session_id:
             # raise ValueError('session_id is required')
             context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
             context.set_details('session_id is required')
-            logging.warn('ChatGPTgRPCServer.Chat: session_id is required')
+            log_event(logging.WARNING, 'Chat.error', request_id=request_id,
+                      code='INVALID_ARGUMENT', details='session_id is required')
             return chatbot_pb2.ChatResponse()
         if not request.prompt:
             # raise ValueError('prompt is required')
             context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
             context.set_details('prompt is required')
-            logging.warn('ChatGPTgRPCServer.Chat: prompt is required')
+            log_event(logging.WARNING, 'Chat.error', request_id=request_id,
+                      session_id=request.session_id,
+                      code='INVALID_ARGUMENT', details='prompt is required')
             return chatbot_pb2.ChatResponse()
 
         response = None
         try:
-            response = self.multiChatGPT.ask(
-                request.session_id, request.prompt)
+            # waits in the session's queue: no thread is held meanwhile
+            response = await asyncio.wrap_future(
+                self.multiChatGPT.submit_ask(request.session_id, request.prompt))
+        except Overloaded as e:
+            _set_overloaded(context, e)
+        except SessionQueueFull as e:
+            _set_busy(context, e)
         except SessionNotFound as e:
             context.set_code(grpc.StatusCode.NOT_FOUND)
             context.set_details(str(e))
@@ -84,26 +219,100 @@ class ChatGPTgRPCServer(chatbot_pb2_grpc.ChatbotServiceServicer):
             context.set_code(grpc.StatusCode.RESOURCE_EXHAUSTED)
             context.set_details(str(e))
 
-        if context.code() != grpc.StatusCode.OK and context.code() != None:
-            logging.warn(
-                f'ChatGPTgRPCServer.Chat: ({context.code()}) {context.details()}')
+        if _code(context) != grpc.StatusCode.OK and _code(context) != None:
+            log_event(logging.WARNING, 'Chat.error', request_id=request_id,
+                      session_id=request.session_id, code=_code(context).name,
+                      details=context.details())
         else:
-            logging.info(
-                f'ChatGPTgRPCServer.Chat: (OK) {response}')
+            log_event(logging.INFO, 'Chat.ok', request_id=request_id,
+                      session_id=request.session_id,
+                      prompt=request.prompt, response=response)
 
         return chatbot_pb2.ChatResponse(response=response)
 
-    def DeleteSession(self, request, context):
+    @_recorded
+    async def ChatStream(self, request, context):
+        """ChatStream is Chat with the response streamed in sentences,
+        each sent as soon as it is complete (and filtered).
+        Input: session_id (string) and prompt (string).
+        Output: a stream of response (string).
+        """
+        request_id = _request_id(context)
+        if not request.session_id:
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            context.set_details('session_id is required')
+            log_event(logging.WARNING, 'ChatStream.error', request_id=request_id,
+                      code='INVALID_ARGUMENT', details='session_id is required')
+            return
+        if not request.prompt:
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            context.set_details('prompt is required')
+            log_event(logging.WARNING, 'ChatStream.error', request_id=request_id,
+                      session_id=request.session_id,
+                      code='INVALID_ARGUMENT', details='prompt is required')
+            return
+
+        # the ask runs on a dispatcher worker, handing sentences over to here
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        stop = threading.Event()  # the client is gone
+
+        def on_sentence(sentence: str) -> bool:
+            loop.call_soon_threadsafe(queue.put_nowait, sentence)
+            return not stop.is_set()
+
+        sentences = 0
+        future = None
+        try:
+            future = asyncio.wrap_future(self.multiChatGPT.submit_ask_stream(
+                request.session_id, request.prompt, on_sentence))
+            # after the sentences: scheduled by the worker after them
+            future.add_done_callback(lambda _: queue.put_nowait(None))
+            while (sentence := await queue.get()) is not None:
+                sentences += 1
+                yield chatbot_pb2.ChatResponse(response=sentence)
+            future.result()  # raises the error of the ask
+        except Overloaded as e:
+            _set_overloaded(context, e)
+        except SessionQueueFull as e:
+            _set_busy(context, e)
+        except SessionNotFound as e:
+            context.set_code(grpc.StatusCode.NOT_FOUND)
+            context.set_details(str(e))
+        except ChatGPTError as e:
+            context.set_code(grpc.StatusCode.UNAVAILABLE)
+            context.set_details(str(e))
+        except CooldownException as e:
+            context.set_code(grpc.StatusCode.RESOURCE_EXHAUSTED)
+            context.set_details(str(e))
+        finally:
+            stop.set()
+            if future is not None:
+                future.cancel()  # not started yet: dropped
+
+        if _code(context) != grpc.StatusCode.OK and _code(context) != None:
+            log_event(logging.WARNING, 'ChatStream.error', request_id=request_id,
+                      session_id=request.session_id, code=_code(context).name,
+                      details=context.details(), sentences=sentences)
+        else:
+            log_event(logging.INFO, 'ChatStream.ok', request_id=request_id,
+                      session_id=request.session_id,
+                      prompt=request.prompt, sentences=sentences)
+
+    @_recorded
+    async def DeleteSession(self, request, context):
         """DeleteSession deletes a session with ChatGPT.
         Input: session_id (string).
         Output: session_id (string).
         """
+        request_id = _request_id(context)
         if not request.session_id:
             # raise ValueError('session_id is required')
             context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
             context.set_details('session_id is required')
-            logging.warn(
-                'ChatGPTgRPCServer.DeleteSession: session_id is required')
+            log_event(logging.WARNING, 'DeleteSession.error',
+                      request_id=request_id, code='INVALID_ARGUMENT',
+                      details='session_id is required')
             return chatbot_pb2.DeleteSessionResponse()
 
         try:
@@ -112,21 +321,120 @@ class ChatGPTgRPCServer(chatbot_pb2_grpc.ChatbotServiceServicer):
             context.set_code(grpc.StatusCode.NOT_FOUND)
             context.set_details(str(e))
 
-        if context.code() != grpc.StatusCode.OK and context.code() != None:
-            logging.warn(
-                f'ChatGPTgRPCServer.DeleteSession: ({context.code()}) {context.details()}')
+        if _code(context) != grpc.StatusCode.OK and _code(context) != None:
+            log_event(logging.WARNING, 'DeleteSession.error',
+                      request_id=request_id, session_id=request.session_id,
+                      code=_code(context).name, details=context.details())
         else:
-            logging.info(
-                f'ChatGPTgRPCServer.DeleteSession: (OK) {request.session_id}')
+            log_event(logging.INFO, 'DeleteSession.ok',
+                      request_id=request_id, session_id=request.session_id)
 
         return chatbot_pb2.DeleteSessionResponse(session_id=request.session_id)
 
+    async def ListSessions(self, request, context):
+        """ListSessions lists the sessions, ordered by session_id.
+        Input: page_size, page_token (the last session_id of the previous page)
+               and min_idle_seconds.
+        Output: sessions, next_page_token and total_size.
+        """
+        page_size = request.page_size or 100
+        now = time.time()
 
-def serveGRPC(address: str = 'localhost:50052'):
-    """Starts a gRPC server at the specified address 'host:port'."""
-    server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
-    chatbot_pb2_grpc.add_ChatbotServiceServicer_to_server(
-        ChatGPTgRPCServer(), server)
+        # SessionStats are a snapshot: no lock is held on the sessions
+        stats = [st for st in self.multiChatGPT.session_stats()
+                 if now - st.touch_at >= request.min_idle_seconds]
+        page = [st for st in stats if st.session_id > request.page_token][:page_size]
+
+        next_page_token = ''
+        if page and page[-1].session_id != stats[-1].session_id:
+            next_page_token = page[-1].session_id
+
+        return chatbot_pb2.ListSessionsResponse(
+            sessions=[chatbot_pb2.SessionInfo(
+                session_id=st.session_id,
+                create_at=st.create_at,
+                touch_at=st.touch_at,
+                history_size=st.history_size,
+                zombie=st.zombie,
+                requests=st.requests,
+                rejected=st.rejected,
+                last_latency=st.last_latency,
+                tokens=st.tokens,
+                queue_depth=st.queue_depth,
+                tier=st.tier,
+                model=st.model) for st in page],
+            next_page_token=next_page_token,
+            total_size=len(stats))
+
+    async def GetStats(self, request, context):
+        """GetStats returns the server stats:
+        sessions, requests, tokens, the dispatcher (calls in flight & queued),
+        rate limits per api key and stats per model.
+        """
+        stats = self.multiChatGPT.session_stats()
+        budgets = v3_token_budget.budgets()
+
+        return chatbot_pb2.GetStatsResponse(
+            sessions=len(stats),
+            zombies=sum(st.zombie for st in stats),
+            requests=sum(st.requests for st in stats),
+            tokens=sum(st.tokens for st in stats),
+            in_flight=self.multiChatGPT.dispatcher.in_flight,
+            queued=self.multiChatGPT.dispatcher.queued,
+            draining=self.draining,
+            keys=[chatbot_pb2.KeyStats(
+                key=key,
+                requests_per_minute=rpm,
+                tokens_per_minute=budgets.get(key, {}).get('capacity', 0),
+                tokens_remaining=budgets.get(key, {}).get('remaining', 0))
+                for key, rpm in v3_cooldown.rates().items()],
+            models=[chatbot_pb2.ModelStats(
+                model=m.model,
+                requests=m.requests,
+                errors=m.errors,
+                in_flight=m.in_flight,
+                latency=m.latency,
+                tokens=m.tokens,
+                cost=m.cost)
+                for m in v3_router.models()])
+
+
+def newGRPCServer(address: str) -> tuple[grpc.aio.Server, ChatGPTgRPCServer]:
+    """A gRPC (asyncio) server, not started, serving ChatGPTgRPCServer at address 'host:port'.
+
+    Call it in the event loop that will run the server.
+    """
+    # calls waiting for ChatGPT are queued per session by the dispatcher,
+    # not parked in the server's threads: no thread pool to size here.
+    server = grpc.aio.server()
+
+    recorder = None
+    if os.getenv('CHATGPT_TRACE_FILE'):
+        recorder = TraceRecorder(os.getenv('CHATGPT_TRACE_FILE'),
+                                 bodies=os.getenv('CHATGPT_TRACE_BODIES', '') == 'True')
+        logging.info(f'gRPC traffic recorded to {recorder.path} (bodies: {recorder.bodies}).')
+
+    servicer = ChatGPTgRPCServer(recorder)
+    chatbot_pb2_grpc.add_ChatbotServiceServicer_to_server(servicer, server)
+    server.add_insecure_port(address)
+    return server, servicer
+
+
+def _drain(server: grpc.aio.Server, servicer: ChatGPTgRPCServer,
+           grace: float = DRAIN_GRACE) -> asyncio.Future:
+    """SIGTERM: reject new sessions & calls, let in-flight calls finish within grace.
+
+    Returns the server.stop() future. Call it in the server's event loop.
+    """
+    dispatcher = servicer.multiChatGPT.dispatcher
+    logging.info(f'gRPC server draining: {dispatcher.in_flight} in flight, '
+                 f'{dispatcher.queued} queued, grace {grace}s')
+    servicer.draining = True
+    return asyncio.ensure_future(server.stop(grace))
+
+
+async def _serve(address: str):
+    server, servicer = newGRPCServer(address)
 
     SERVICE_NAMES = [
         chatbot_pb2.DESCRIPTOR.services_by_name['ChatbotService'].full_name]
@@ -139,8 +447,18 @@ def serveGRPC(address: str = 'localhost:50052'):
 
         logging.info(f'gRPC reflection enabled.')
 
-    server.add_insecure_port(address)
-    server.start()
+    await server.start()
     print(f'ChatGPT gRPC server started at {address}.')
     print(f'Services: {SERVICE_NAMES}')
-    server.wait_for_termination()
+
+    stopping = []
+    asyncio.get_running_loop().add_signal_handler(
+        signal.SIGTERM, lambda: stopping.append(_drain(server, servicer)))
+    await server.wait_for_termination()
+    servicer.multiChatGPT.dispatcher.shutdown()
+    logging.info('gRPC server stopped.')
+
+
+def serveGRPC(address: str = 'localhost:50052'):
+    """Starts a gRPC server at the specified address 'host:port'."""
+    asyncio.run(_serve(address))
@@ -13,7 +13,7 @@ _sym_db = _symbol_database.Default()
 
 
 
-DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n!muvtuber/chatbot/v2/chatbot.proto\x12\x13muvtuber.chatbot.v2\"R\n\x11NewSessionRequest\x12\x16\n\x06\x63onfig\x18\x01 \x01(\tR\x06\x63onfig\x12%\n\x0einitial_prompt\x18\x02 \x01(\tR\rinitialPrompt\"^\n\x12NewSessionResponse\x12\x1d\n\nsession_id\x18\x01 \x01(\tR\tsessionId\x12)\n\x10initial_response\x18\x02 \x01(\tR\x0finitialResponse\"5\n\x14\x44\x65leteSessionRequest\x12\x1d\n\nsession_id\x18\x01 \x01(\tR\tsessionId\"6\n\x15\x44\x65leteSessionResponse\x12\x1d\n\nsession_id\x18\x01 \x01(\tR\tsessionId\"D\n\x0b\x43hatRequest\x12\x1d\n\nsession_id\x18\x01 \x01(\tR\tsessionId\x12\x16\n\x06prompt\x18\x02 \x01(\tR\x06prompt\"*\n\x0c\x43hatResponse\x12\x1a\n\x08response\x18\x02 \x01(\tR\x08response2\xa4\x02\n\x0e\x43hatbotService\x12]\n\nNewSession\x12&.muvtuber.chatbot.v2.NewSessionRequest\x1a\'.muvtuber.chatbot.v2.NewSessionResponse\x12K\n\x04\x43hat\x12 .muvtuber.chatbot.v2.ChatRequest\x1a!.muvtuber.chatbot.v2.ChatResponse\x12\x66\n\rDeleteSession\x12).muvtuber.chatbot.v2.DeleteSessionRequest\x1a*.muvtuber.chatbot.v2.DeleteSessionResponseB\xc7\x01\n\x17\x63om.muvtuber.chatbot.v2B\x0c\x43hatbotProtoP\x01Z0muvtuberdriver/gen/muvtuber/chatbot/v2;chatbotv2\xa2\x02\x03MCX\xaa\x02\x13Muvtuber.Chatbot.V2\xca\x02\x13Muvtuber\\Chatbot\\V2\xe2\x02\x1fMuvtuber\\Chatbot\\V2\\GPBMetadata\xea\x02\x15Muvtuber::Chatbot::V2b\x06proto3')
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n!muvtuber/chatbot/v2/chatbot.proto\x12\x13muvtuber.chatbot.v2\"R\n\x11NewSessionRequest\x12\x16\n\x06\x63onfig\x18\x01 \x01(\tR\x06\x63onfig\x12%\n\x0einitial_prompt\x18\x02 \x01(\tR\rinitialPrompt\"^\n\x12NewSessionResponse\x12\x1d\n\nsession_id\x18\x01 \x01(\tR\tsessionId\x12)\n\x10initial_response\x18\x02 \x01(\tR\x0finitialResponse\"5\n\x14\x44\x65leteSessionRequest\x12\x1d\n\nsession_id\x18\x01 \x01(\tR\tsessionId\"6\n\x15\x44\x65leteSessionResponse\x12\x1d\n\nsession_id\x18\x01 \x01(\tR\tsessionId\"D\n\x0b\x43hatRequest\x12\x1d\n\nsession_id\x18\x01 \x01(\tR\tsessionId\x12\x16\n\x06prompt\x18\x02 \x01(\tR\x06prompt\"*\n\x0c\x43hatResponse\x12\x1a\n\x08response\x18\x02 \x01(\tR\x08response\"{\n\x13ListSessionsRequest\x12\x1b\n\tpage_size\x18\x01 \x01(\x05R\x08pageSize\x12\x1d\n\npage_token\x18\x02 \x01(\tR\tpageToken\x12(\n\x10min_idle_seconds\x18\x03 \x01(\x03R\x0eminIdleSeconds\"\xdd\x02\n\x0bSessionInfo\x12\x1d\n\nsession_id\x18\x01 \x01(\tR\tsessionId\x12\x1b\n\tcreate_at\x18\x02 \x01(\x01R\x08\x63reateAt\x12\x19\n\x08touch_at\x18\x03 \x01(\x01R\x07touchAt\x12!\n\x0chistory_size\x18\x04 \x01(\x05R\x0bhistorySize\x12\x16\n\x06zombie\x18\x05 \x01(\x08R\x06zombie\x12\x1a\n\x08requests\x18\x06 \x01(\x03R\x08requests\x12!\n\x0clast_latency\x18\x07 \x01(\x01R\x0blastLatency\x12\x16\n\x06tokens\x18\x08 \x01(\x03R\x06tokens\x12\x1f\n\x0bqueue_depth\x18\t \x01(\x05R\nqueueDepth\x12\x12\n\x04tier\x18\n \x01(\tR\x04tier\x12\x14\n\x05model\x18\x0b \x01(\tR\x05model\x12\x1a\n\x08rejected\x18\x0c \x01(\x03R\x08rejected\"\x9b\x01\n\x14ListSessionsResponse\x12<\n\x08sessions\x18\x01 \x03(\x0b\x32 .muvtuber.chatbot.v2.SessionInfoR\x08sessions\x12&\n\x0fnext_page_token\x18\x02 \x01(\tR\rnextPageToken\x12\x1d\n\ntotal_size\x18\x03 \x01(\x05R\ttotalSize\"\x11\n\x0fGetStatsRequest\"\xa3\x01\n\x08KeyStats\x12\x10\n\x03key\x18\x01 \x01(\tR\x03key\x12.\n\x13requests_per_minute\x18\x02 \x01(\x01R\x11requestsPerMinute\x12*\n\x11tokens_per_minute\x18\x03 \x01(\x01R\x0ftokensPerMinute\x12)\n\x10tokens_remaining\x18\x04 \x01(\x01R\x0ftokensRemaining\"\xb9\x01\n\nModelStats\x12\x14\n\x05model\x18\x01 \x01(\tR\x05model\x12\x1a\n\x08requests\x18\x02 \x01(\x03R\x08requests\x12\x16\n\x06\x65rrors\x18\x03 \x01(\x03R\x06\x65rrors\x12\x1b\n\tin_flight\x18\x04 \x01(\x05R\x08inFlight\x12\x18\n\x07latency\x18\x05 \x01(\x01R\x07latency\x12\x16\n\x06tokens\x18\x06 \x01(\x03R\x06tokens\x12\x12\n\x04\x63ost\x18\x07 \x01(\x01R\x04\x63ost\"\xb9\x02\n\x10GetStatsResponse\x12\x1a\n\x08sessions\x18\x01 \x01(\x05R\x08sessions\x12\x18\n\x07zombies\x18\x02 \x01(\x05R\x07zombies\x12\x1a\n\x08requests\x18\x03 \x01(\x03R\x08requests\x12\x16\n\x06tokens\x18\x04 \x01(\x03R\x06tokens\x12\x1b\n\tin_flight\x18\x05 \x01(\x05R\x08inFlight\x12\x16\n\x06queued\x18\x06 \x01(\x05R\x06queued\x12\x1a\n\x08\x64raining\x18\x07 \x01(\x08R\x08\x64raining\x12\x31\n\x04keys\x18\x08 \x03(\x0b\x32\x1d.muvtuber.chatbot.v2.KeyStatsR\x04keys\x12\x37\n\x06models\x18\t \x03(\x0b\x32\x1f.muvtuber.chatbot.v2.ModelStatsR\x06models2\xb7\x04\n\x0e\x43hatbotService\x12]\n\nNewSession\x12&.muvtuber.chatbot.v2.NewSessionRequest\x1a\'.muvtuber.chatbot.v2.NewSessionResponse\x12K\n\x04\x43hat\x12 .muvtuber.chatbot.v2.ChatRequest\x1a!.muvtuber.chatbot.v2.ChatResponse\x12S\n\nChatStream\x12 .muvtuber.chatbot.v2.ChatRequest\x1a!.muvtuber.chatbot.v2.ChatResponse0\x01\x12\x66\n\rDeleteSession\x12).muvtuber.chatbot.v2.DeleteSessionRequest\x1a*.muvtuber.chatbot.v2.DeleteSessionResponse\x12\x63\n\x0cListSessions\x12(.muvtuber.chatbot.v2.ListSessionsRequest\x1a).muvtuber.chatbot.v2.ListSessionsResponse\x12W\n\x08GetStats\x12$.muvtuber.chatbot.v2.GetStatsRequest\x1a%.muvtuber.chatbot.v2.GetStatsResponseB\xc7\x01\n\x17\x63om.muvtuber.chatbot.v2B\x0c\x43hatbotProtoP\x01Z0muvtuberdriver/gen/muvtuber/chatbot/v2;chatbotv2\xa2\x02\x03MCX\xaa\x02\x13Muvtuber.Chatbot.V2\xca\x02\x13Muvtuber\\Chatbot\\V2\xe2\x02\x1fMuvtuber\\Chatbot\\V2\\GPBMetadata\xea\x02\x15Muvtuber::Chatbot::V2b\x06proto3')
 
 _globals = globals()
 _builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
@@ -34,6 +34,20 @@ if _descriptor._USE_C_DESCRIPTORS == False:
   _globals['_CHATREQUEST']._serialized_end=417
   _globals['_CHATRESPONSE']._serialized_start=419
   _globals['_CHATRESPONSE']._serialized_end=461
-  _globals['_CHATBOTSERVICE']._serialized_start=464
-  _globals['_CHATBOTSERVICE']._serialized_end=756
+  _globals['_LISTSESSIONSREQUEST']._serialized_start=463
+  _globals['_LISTSESSIONSREQUEST']._serialized_end=586
+  _globals['_SESSIONINFO']._serialized_start=589
+  _globals['_SESSIONINFO']._serialized_end=938
+  _globals['_LISTSESSIONSRESPONSE']._serialized_start=941
+  _globals['_LISTSESSIONSRESPONSE']._serialized_end=1096
+  _globals['_GETSTATSREQUEST']._serialized_start=1098
+  _globals['_GETSTATSREQUEST']._serialized_end=1115
+  _globals['_KEYSTATS']._serialized_start=1118
+  _globals['_KEYSTATS']._serialized_end=1281
+  _globals['_MODELSTATS']._serialized_start=1284
+  _globals['_MODELSTATS']._serialized_end=1469
+  _globals['_GETSTATSRESPONSE']._serialized_start=1472
+  _globals['_GETSTATSRESPONSE']._serialized_end=1785
+  _globals['_CHATBOTSERVICE']._serialized_start=1788
+  _globals['_CHATBOTSERVICE']._serialized_end=2355
 # @@protoc_insertion_point(module_scope)
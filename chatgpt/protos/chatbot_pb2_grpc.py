@@ -24,11 +24,26 @@ class ChatbotServiceStub(object):
                 request_serializer=muvtuber_dot_chatbot_dot_v2_dot_chatbot__pb2.ChatRequest.SerializeToString,
                 response_deserializer=muvtuber_dot_chatbot_dot_v2_dot_chatbot__pb2.ChatResponse.FromString,
                 )
+        self.ChatStream = channel.unary_stream(
+                '/muvtuber.chatbot.v2.ChatbotService/ChatStream',
+                request_serializer=muvtuber_dot_chatbot_dot_v2_dot_chatbot__pb2.ChatRequest.SerializeToString,
+                response_deserializer=muvtuber_dot_chatbot_dot_v2_dot_chatbot__pb2.ChatResponse.FromString,
+                )
         self.DeleteSession = channel.unary_unary(
                 '/muvtuber.chatbot.v2.ChatbotService/DeleteSession',
                 request_serializer=muvtuber_dot_chatbot_dot_v2_dot_chatbot__pb2.DeleteSessionRequest.SerializeToString,
                 response_deserializer=muvtuber_dot_chatbot_dot_v2_dot_chatbot__pb2.DeleteSessionResponse.FromString,
                 )
+        self.ListSessions = channel.unary_unary(
+                '/muvtuber.chatbot.v2.ChatbotService/ListSessions',
+                request_serializer=muvtuber_dot_chatbot_dot_v2_dot_chatbot__pb2.ListSessionsRequest.SerializeToString,
+                response_deserializer=muvtuber_dot_chatbot_dot_v2_dot_chatbot__pb2.ListSessionsResponse.FromString,
+                )
+        self.GetStats = channel.unary_unary(
+                '/muvtuber.chatbot.v2.ChatbotService/GetStats',
+                request_serializer=muvtuber_dot_chatbot_dot_v2_dot_chatbot__pb2.GetStatsRequest.SerializeToString,
+                response_deserializer=muvtuber_dot_chatbot_dot_v2_dot_chatbot__pb2.GetStatsResponse.FromString,
+                )
 
 
 class ChatbotServiceServicer(object):
@@ -52,6 +67,16 @@ class ChatbotServiceServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def ChatStream(self, request, context):
+        """ChatStream is Chat with the response streamed in sentences (or clauses),
+        each sent as soon as it is complete.
+        Input: session_id (string) and prompt (string).
+        Output: a stream of response (string).
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
     def DeleteSession(self, request, context):
         """DeleteSession deletes a session with Chatbot.
         Input: session_id (string).
@@ -61,6 +86,22 @@ class ChatbotServiceServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def ListSessions(self, request, context):
+        """ListSessions lists the sessions, ordered by session_id.
+        Input: page_size, page_token and min_idle_seconds (filter).
+        Output: sessions and next_page_token ("" on the last page).
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def GetStats(self, request, context):
+        """GetStats returns the server stats: sessions, requests, tokens & limits.
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
 
 def add_ChatbotServiceServicer_to_server(servicer, server):
     rpc_method_handlers = {
@@ -74,11 +115,26 @@ def add_ChatbotServiceServicer_to_server(servicer, server):
                     request_deserializer=muvtuber_dot_chatbot_dot_v2_dot_chatbot__pb2.ChatRequest.FromString,
                     response_serializer=muvtuber_dot_chatbot_dot_v2_dot_chatbot__pb2.ChatResponse.SerializeToString,
             ),
+            'ChatStream': grpc.unary_stream_rpc_method_handler(
+                    servicer.ChatStream,
+                    request_deserializer=muvtuber_dot_chatbot_dot_v2_dot_chatbot__pb2.ChatRequest.FromString,
+                    response_serializer=muvtuber_dot_chatbot_dot_v2_dot_chatbot__pb2.ChatResponse.SerializeToString,
+            ),
             'DeleteSession': grpc.unary_unary_rpc_method_handler(
                     servicer.DeleteSession,
                     request_deserializer=muvtuber_dot_chatbot_dot_v2_dot_chatbot__pb2.DeleteSessionRequest.FromString,
                     response_serializer=muvtuber_dot_chatbot_dot_v2_dot_chatbot__pb2.DeleteSessionResponse.SerializeToString,
             ),
+            'ListSessions': grpc.unary_unary_rpc_method_handler(
+                    servicer.ListSessions,
+                    request_deserializer=muvtuber_dot_chatbot_dot_v2_dot_chatbot__pb2.ListSessionsRequest.FromString,
+                    response_serializer=muvtuber_dot_chatbot_dot_v2_dot_chatbot__pb2.ListSessionsResponse.SerializeToString,
+            ),
+            'GetStats': grpc.unary_unary_rpc_method_handler(
+                    servicer.GetStats,
+                    request_deserializer=muvtuber_dot_chatbot_dot_v2_dot_chatbot__pb2.GetStatsRequest.FromString,
+                    response_serializer=muvtuber_dot_chatbot_dot_v2_dot_chatbot__pb2.GetStatsResponse.SerializeToString,
+            ),
     }
     generic_handler = grpc.method_handlers_generic_handler(
             'muvtuber.chatbot.v2.ChatbotService', rpc_method_handlers)
@@ -123,6 +179,23 @@ class ChatbotService(object):
             options, channel_credentials,
             insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
 
+    @staticmethod
+    def ChatStream(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_stream(request, target, '/muvtuber.chatbot.v2.ChatbotService/ChatStream',
+            muvtuber_dot_chatbot_dot_v2_dot_chatbot__pb2.ChatRequest.SerializeToString,
+            muvtuber_dot_chatbot_dot_v2_dot_chatbot__pb2.ChatResponse.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
     @staticmethod
     def DeleteSession(request,
             target,
@@ -139,3 +212,37 @@ class ChatbotService(object):
             muvtuber_dot_chatbot_dot_v2_dot_chatbot__pb2.DeleteSessionResponse.FromString,
             options, channel_credentials,
             insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def ListSessions(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(request, target, '/muvtuber.chatbot.v2.ChatbotService/ListSessions',
+            muvtuber_dot_chatbot_dot_v2_dot_chatbot__pb2.ListSessionsRequest.SerializeToString,
+            muvtuber_dot_chatbot_dot_v2_dot_chatbot__pb2.ListSessionsResponse.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def GetStats(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(request, target, '/muvtuber.chatbot.v2.ChatbotService/GetStats',
+            muvtuber_dot_chatbot_dot_v2_dot_chatbot__pb2.GetStatsRequest.SerializeToString,
+            muvtuber_dot_chatbot_dot_v2_dot_chatbot__pb2.GetStatsResponse.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
@@ -0,0 +1,93 @@
+"""
+recorder: a compact trace of the RPCs a server receives, for replay.py.
+
+One JSON object per line. The first line is a header: {"v": 1, "start": unix time}.
+Then a line per RPC (written when it completes, so ordered by completion):
+
+    t     arrival, seconds since start
+    rpc   NewSession | Chat | ChatStream | DeleteSession
+    sid   session_id (the one NewSession returned)
+    key   sha1 of the api_key, 8 hex (NewSession): never the key itself
+    v     API version (NewSession)
+    n     prompt (initial_prompt for NewSession) length in characters
+    h     sha1 of the prompt, 12 hex: duplicates share it
+    p     the prompt itself, only if bodies are recorded
+    code  status code name
+    lat   seconds the RPC took
+
+Environment variables (grpcapi):
+
+CHATGPT_TRACE_FILE:   record the trace to this file (default: no recording)
+CHATGPT_TRACE_BODIES: if set to True, also record the prompts (default: False)
+"""
+
+import atexit
+import hashlib
+import json
+import logging
+import queue
+import threading
+import time
+
+
+def _sha1(s: str, n: int) -> str:
+    return hashlib.sha1(s.encode('utf-8')).hexdigest()[:n]
+
+
+class TraceRecorder:
+    """TraceRecorder appends RPC records to a trace file from a background thread."""
+
+    def __init__(self, path: str, bodies: bool = False):
+        self.path = path
+        self.bodies = bodies
+        self.start = time.time()
+
+        self._queue = queue.SimpleQueue()
+        self._file = open(path, 'a', encoding='utf-8')
+        self._write({"v": 1, "start": self.start})
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def record(self, rpc: str, arrival: float, code, session_id: str = '',
+               prompt: str | None = None, **extra):
+        """Record an RPC that arrived at arrival (unix time) and ended with code."""
+        r = {"t": round(arrival - self.start, 3), "rpc": rpc}
+        if session_id:
+            r["sid"] = session_id
+        if prompt is not None:
+            r["n"] = len(prompt)
+            r["h"] = _sha1(prompt, 12)
+            if self.bodies:
+                r["p"] = prompt
+        r.update(extra)
+        r["code"] = getattr(code, 'name', None) or 'OK'
+        r["lat"] = round(time.time() - arrival, 3)
+        self._queue.put(r)
+
+    @staticmethod
+    def key_hash(key: str) -> str:
+        return _sha1(key, 8)
+
+    def _write(self, r: dict):
+        self._file.write(json.dumps(r, ensure_ascii=False, separators=(',', ':')) + '\n')
+
+    def _run(self):
+        while True:
+            r = self._queue.get()
+            if r is None:
+                break
+            try:
+                self._write(r)
+                if self._queue.empty():
+                    self._file.flush()
+            except Exception as e:
+                logging.error(f"TraceRecorder: write {self.path} error: {e}")
+
+    def close(self):
+        if self._file.closed:
+            return
+        self._queue.put(None)
+        self._thread.join(timeout=5)
+        self._file.close()
@@ -0,0 +1,343 @@
+"""
+Replay a traffic trace (recorded with CHATGPT_TRACE_FILE) against a gRPC
+server, and report latencies & rejections.
+
+By default the server is this build, started in-process (with the current
+environment variables) and backed by a local fake upstream: no request
+leaves the box. Use --target to replay against a running server instead
+(start it with API_URL=http://<--upstream address>/v1/chat/completions).
+
+    python chatgpt/replay.py trace.jsonl --speed 10 --out new.json --baseline old.json
+
+Sessions are recreated as in the trace; calls that were NOT_FOUND or had
+no session_id are sent as recorded, to fail the same way. Prompts are the recorded ones, or
+fillers of the recorded length (the same for duplicates) if bodies were
+not recorded. Compare two builds by replaying the same trace on each, the
+second time with --baseline <the first --out>.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import statistics
+import sys
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent import futures
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import grpc
+
+from protos import chatbot_pb2, chatbot_pb2_grpc
+
+REJECTIONS = ('RESOURCE_EXHAUSTED', 'UNAVAILABLE')
+
+
+# Fake upstream: the OpenAI chat completions API (streamed), with rate limits
+
+class FakeUpstream(ThreadingHTTPServer):
+    """FakeUpstream answers every chat completion with a fixed-size reply,
+    streamed after ttfb seconds at tps deltas per second.
+
+    Requests over rpm per api key in the last minute get 429 + retry-after.
+    """
+    daemon_threads = True
+
+    def __init__(self, address, ttfb: float, tps: float, reply_chars: int, rpm: int):
+        self.ttfb = ttfb
+        self.tps = tps
+        self.reply_chars = reply_chars
+        self.rpm = rpm
+        self.requests = defaultdict(deque)  # key -> times of the last minute
+        self.lock = threading.Lock()
+        super().__init__(address, _FakeUpstreamHandler)
+
+    def handle_error(self, request, client_address):
+        # clients dropping keep-alive connections at exit: not worth a traceback
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    def admit(self, key: str) -> tuple[bool, int, float]:
+        """-> (ok, remaining, seconds to reset)"""
+        with self.lock:
+            now = time.time()
+            q = self.requests[key]
+            while q and now - q[0] > 60:
+                q.popleft()
+            if len(q) >= self.rpm:
+                return False, 0, 60 - (now - q[0])
+            q.append(now)
+            return True, self.rpm - len(q), 60 - (now - q[0])
+
+    def reply(self) -> str:
+        s = "好的，收到。This is a replayed response. "
+        return (s * (self.reply_chars // len(s) + 1))[:self.reply_chars]
+
+
+class _FakeUpstreamHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        up: FakeUpstream = self.server
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        ok, remaining, reset = up.admit(self.headers.get('Authorization', ''))
+
+        if not ok:
+            body = b'{"error": {"message": "Rate limit reached", "type": "requests"}}'
+            self.send_response(429)
+            self.send_header('retry-after', str(max(1, int(reset))))
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        time.sleep(up.ttfb)
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.send_header('x-ratelimit-limit-requests', str(up.rpm))
+        self.send_header('x-ratelimit-remaining-requests', str(remaining))
+        self.send_header('x-ratelimit-reset-requests', f'{reset:.0f}s')
+        self.end_headers()
+
+        reply = up.reply()
+        deltas = [{"role": "assistant"}] + \
+            [{"content": reply[i:i + 4]} for i in range(0, len(reply), 4)]
+        for delta in deltas:
+            self._chunk(b'data: ' + json.dumps(
+                {"choices": [{"delta": delta}]}, ensure_ascii=False).encode() + b'\n\n')
+            time.sleep(1 / up.tps)
+        self._chunk(b'data: [DONE]\n\n')
+        self._chunk(b'')
+
+    def _chunk(self, data: bytes):
+        self.wfile.write(f'{len(data):x}\r\n'.encode() + data + b'\r\n')
+        self.wfile.flush()
+
+    def log_message(self, format, *args):
+        pass
+
+
+# Replay
+
+def load_trace(path: str) -> tuple[dict, list[dict]]:
+    """-> (header, records ordered by arrival)"""
+    with open(path, encoding='utf-8') as f:
+        lines = [json.loads(line) for line in f if line.strip()]
+    header, records = lines[0], lines[1:]
+    records.sort(key=lambda r: r['t'])
+    return header, records
+
+
+def prompt_of(r: dict) -> str:
+    """the recorded prompt, or a filler of its length (the same for the same hash)"""
+    if 'p' in r:
+        return r['p']
+    n, h = r.get('n', 0), r.get('h', '')
+    filler = f'{h} ' if h else 'x '
+    return (filler * (n // len(filler) + 1))[:n]
+
+
+class Replayer:
+    """Replayer re-drives the RPCs of a trace at speed x, recording the results."""
+
+    def __init__(self, target: str, speed: float, timeout: float, concurrency: int):
+        self.stub = chatbot_pb2_grpc.ChatbotServiceStub(grpc.insecure_channel(target))
+        self.speed = speed
+        self.timeout = timeout
+        self.pool = futures.ThreadPoolExecutor(max_workers=concurrency)
+
+        self.sessions: dict[str, futures.Future] = {}  # recorded -> new session_id
+        self.results: list[dict] = []
+        self.lock = threading.Lock()
+
+    def run(self, records: list[dict]) -> float:
+        """replay records, return the wall time"""
+        start = time.time()
+        pending = []
+        for r in records:
+            delay = start + r['t'] / self.speed - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            pending.append(self._submit(r))
+        futures.wait(pending)
+        return time.time() - start
+
+    def _submit(self, r: dict) -> futures.Future:
+        sid = r.get('sid', '')
+        if r['rpc'] == 'NewSession':
+            f = futures.Future()
+            if sid:  # a failed NewSession has none: no call refers to it
+                self.sessions[sid] = f
+            return self.pool.submit(self._new_session, r, f)
+        return self.pool.submit(self._call, r, self._session(sid, r.get('code') != 'NOT_FOUND'))
+
+    def _session(self, sid: str, implicit: bool) -> futures.Future | None:
+        """the session recorded as sid. If implicit, a session created before
+        the trace started: create it now. None: the call is sent as recorded
+        (no sid, or one that was not found)."""
+        with self.lock:
+            if sid not in self.sessions:
+                if not sid or not implicit:
+                    return None
+                f = self.sessions[sid] = futures.Future()
+                self.pool.submit(self._new_session, {'rpc': 'NewSession', 'implicit': True, 'v': 3}, f)
+            return self.sessions[sid]
+
+    def _new_session(self, r: dict, f: futures.Future):
+        # the recorded version: a NewSession rejected for a bad one is rejected again
+        config = json.dumps({"version": r.get('v'),
+                             "api_key": f"sk-replay-{r.get('key', 'default'):0<40}"})
+        request = chatbot_pb2.NewSessionRequest(config=config, initial_prompt=prompt_of(r))
+        resp = self._timed(r, self.stub.NewSession, request)
+        f.set_result(resp.session_id if resp else None)
+
+    def _call(self, r: dict, session: futures.Future | None):
+        if session is None:
+            session_id = r.get('sid', '')
+        else:
+            session_id = session.result()
+            if not session_id:
+                self._result(r, 'SKIPPED', 0)  # NewSession failed
+                return
+        if r['rpc'] == 'DeleteSession':
+            self._timed(r, self.stub.DeleteSession,
+                        chatbot_pb2.DeleteSessionRequest(session_id=session_id))
+            return
+        request = chatbot_pb2.ChatRequest(session_id=session_id, prompt=prompt_of(r))
+        if r['rpc'] == 'ChatStream':
+            self._timed(r, lambda req, timeout: list(self.stub.ChatStream(req, timeout=timeout)), request)
+        else:
+            self._timed(r, self.stub.Chat, request)
+
+    def _timed(self, r: dict, method, request):
+        start = time.time()
+        try:
+            resp = method(request, timeout=self.timeout)
+            self._result(r, 'OK', time.time() - start)
+            return resp
+        except grpc.RpcError as e:
+            self._result(r, e.code().name, time.time() - start)
+            return None
+
+    def _result(self, r: dict, code: str, latency: float):
+        rpc = r['rpc'] + (' (implicit)' if r.get('implicit') else '')
+        with self.lock:
+            self.results.append({'rpc': rpc, 'code': code, 'lat': latency})
+
+
+def _percentile(values: list[float], p: float) -> float:
+    if not values:
+        return 0
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method='inclusive')[int(p) - 1]
+
+
+def report(results: list[dict]) -> dict:
+    """{rpc: {count, codes, rejected, p50, p90, p99, max}}, latencies of the OK calls"""
+    by_rpc = defaultdict(list)
+    for r in results:
+        by_rpc[r['rpc']].append(r)
+
+    rep = {}
+    for rpc, rs in sorted(by_rpc.items()):
+        codes = defaultdict(int)
+        for r in rs:
+            codes[r['code']] += 1
+        lats = sorted(r['lat'] for r in rs if r['code'] == 'OK')
+        rep[rpc] = {
+            'count': len(rs),
+            'codes': dict(codes),
+            'rejected': sum(codes[c] for c in REJECTIONS),
+            'p50': round(_percentile(lats, 50), 3),
+            'p90': round(_percentile(lats, 90), 3),
+            'p99': round(_percentile(lats, 99), 3),
+            'max': round(lats[-1], 3) if lats else 0,
+        }
+    return rep
+
+
+def print_report(rep: dict, baseline: dict | None = None):
+    metrics = ('count', 'rejected', 'p50', 'p90', 'p99', 'max')
+    for rpc, r in rep.items():
+        print(f'{rpc}: {r["codes"]}')
+        b = (baseline or {}).get(rpc)
+        for m in metrics:
+            line = f'  {m:9} {r[m]:10}'
+            if b is not None:
+                line += f'   baseline {b.get(m, 0):10}   delta {r[m] - b.get(m, 0):+.3f}'
+            print(line)
+
+
+async def start_server(address: str):
+    """start this build's gRPC server in the running loop"""
+    import grpcapi
+    server, _ = grpcapi.newGRPCServer(address)
+    await server.start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("trace", help="trace file recorded with CHATGPT_TRACE_FILE")
+    parser.add_argument("--speed", type=float, default=1, help="replay speed: 1 = as recorded, 10 = 10x faster (default 1)")
+    parser.add_argument("--target", type=str, default="",
+                        help="gRPC server address: host:port (default: this build, in-process)")
+    parser.add_argument("--grpc", type=str, default="localhost:50099", help="in-process gRPC server address (default localhost:50099)")
+    parser.add_argument("--upstream", type=str, default="localhost:50098", help="fake upstream address (default localhost:50098)")
+    parser.add_argument("--upstream-ttfb", type=float, default=0.5, help="fake upstream: seconds to the first token (default 0.5)")
+    parser.add_argument("--upstream-tps", type=float, default=50, help="fake upstream: deltas per second (default 50)")
+    parser.add_argument("--upstream-rpm", type=int, default=3500, help="fake upstream: requests per minute per key (default 3500)")
+    parser.add_argument("--reply-chars", type=int, default=80, help="fake upstream: reply length (default 80)")
+    parser.add_argument("--timeout", type=float, default=120, help="RPC timeout in seconds (default 120)")
+    parser.add_argument("--concurrency", type=int, default=256, help="max concurrent RPCs (default 256)")
+    parser.add_argument("--out", type=str, default="", help="write the report (JSON) to this file")
+    parser.add_argument("--baseline", type=str, default="", help="a previous --out report to compare with")
+    args = parser.parse_args()
+
+    host, port = args.upstream.split(":")
+    upstream = FakeUpstream((host, int(port)), args.upstream_ttfb, args.upstream_tps,
+                            args.reply_chars, args.upstream_rpm)
+    threading.Thread(target=upstream.serve_forever, daemon=True).start()
+
+    target = args.target
+    if not target:
+        os.environ["API_URL"] = f"http://{args.upstream}/v1/chat/completions"
+        os.environ.pop("CHATGPT_TRACE_FILE", None)  # do not record the replay
+
+        loop = asyncio.new_event_loop()
+        threading.Thread(target=loop.run_forever, daemon=True).start()
+        # keep a reference: a grpc.aio server is stopped when collected
+        server = asyncio.run_coroutine_threadsafe(start_server(args.grpc), loop).result()
+        target = args.grpc
+
+    header, records = load_trace(args.trace)
+    print(f'replaying {len(records)} RPCs from {args.trace} at {args.speed}x to {target}')
+
+    replayer = Replayer(target, args.speed, args.timeout, args.concurrency)
+    wall = replayer.run(records)
+
+    rep = report(replayer.results)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)['rpcs']
+    print(f'done in {wall:.1f}s')
+    print_report(rep, baseline)
+
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump({'trace': args.trace, 'speed': args.speed, 'wall': round(wall, 3),
+                       'rpcs': rep}, f, indent=2)
+
+    upstream.shutdown()
+
+
+if __name__ == "__main__":
+    logging.basicConfig()
+    logging.getLogger().setLevel(logging.WARNING)
+    main()
@@ -0,0 +1,193 @@
+"""
+router: pick the model (V3 engine) of each ask by rules, with per-model stats.
+
+Rules are tried in order; the first one matching the request wins, the
+default model otherwise. A rule is a JSON object: a model and conditions,
+all optional:
+
+    {"model": "gpt-3.5-turbo", "max_prompt": 200}
+    {"model": "gpt-4", "tiers": ["pro"], "max_latency": 20, "max_in_flight": 4}
+
+    max_prompt, min_prompt: prompt length in characters
+    tiers:                  the session tier (NewSession config "tier") is one of
+    max_in_flight:          fewer asks than this are running on the model
+    max_latency:            the model's recent latency (EWMA, seconds) is below
+    max_hourly_cost:        USD spent on the model in the current hour is below
+
+The last three are fed back by observe(): a slow, busy or expensive model
+is skipped until it recovers, and the request falls through to the next rule.
+A model skipped for its latency gets one ask again once that is `retry`
+seconds old: it cannot recover without new asks.
+
+Environment variables (chatbot):
+
+CHATGPT_V3_ROUTES: a JSON list of rules (default: [], always the default model)
+"""
+
+import json
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+# the engines revChatGPT (V3) counts tokens for
+MODELS = ("gpt-3.5-turbo", "gpt-3.5-turbo-0301",
+          "gpt-4", "gpt-4-0314", "gpt-4-32k", "gpt-4-32k-0314")
+
+# USD / 1K tokens, prompt & completion averaged
+# https://openai.com/pricing
+PRICES = {
+    "gpt-3.5-turbo": 0.002,
+    "gpt-3.5-turbo-0301": 0.002,
+    "gpt-4": 0.045,
+    "gpt-4-0314": 0.045,
+    "gpt-4-32k": 0.09,
+    "gpt-4-32k-0314": 0.09,
+}
+
+
+@dataclass
+class Rule:
+    model: str
+    max_prompt: Optional[int] = None
+    min_prompt: Optional[int] = None
+    tiers: Optional[List[str]] = None
+    max_in_flight: Optional[int] = None
+    max_latency: Optional[float] = None
+    max_hourly_cost: Optional[float] = None
+
+
+@dataclass
+class ModelStats:
+    """ModelStats: asks routed to a model, for routing & operators"""
+    model: str
+    requests: int = 0
+    errors: int = 0
+    in_flight: int = 0
+    latency: float = 0         # EWMA of the ask latency, seconds
+    tokens: int = 0
+    cost: float = 0            # USD, since start
+    hour_cost: float = 0       # USD, in the current hour
+    observed_at: float = 0     # unix time of the last observe()
+    hour: int = field(default=0, repr=False)
+
+
+def parse_rules(s: str) -> List[Rule]:
+    """CHATGPT_V3_ROUTES -> rules. Bad rules are logged and dropped."""
+    if not s.strip():
+        return []
+    try:
+        items = json.loads(s)
+        if not isinstance(items, list):
+            raise ValueError("not a list")
+    except ValueError as e:
+        logging.error(f"router: bad CHATGPT_V3_ROUTES: {e}")
+        return []
+
+    rules = []
+    for item in items:
+        try:
+            rule = Rule(**item)
+        except TypeError as e:
+            logging.error(f"router: bad rule {item}: {e}")
+            continue
+        if rule.model not in MODELS:
+            logging.error(f"router: bad rule {item}: unsupported model {rule.model!r}")
+            continue
+        rules.append(rule)
+    return rules
+
+
+class ModelRouter:
+    """ModelRouter routes asks to models by rules and keeps per-model stats.
+
+        model = router.route(prompt, tier)
+        ... ask model ...
+        router.observe(model, latency, tokens, ok)
+
+    route() counts the ask in flight on the model until observe() or release().
+    """
+
+    def __init__(self, rules: List[Rule], default: str,
+                 smoothing: float = 0.3, retry: float = 60):
+        self.rules = rules
+        self.default = default
+        self.smoothing = smoothing  # weight of the latest latency in the EWMA
+        self.retry = retry
+
+        self._models: Dict[str, ModelStats] = {}
+        self._lock = threading.Lock()
+
+    def _stats(self, model: str) -> ModelStats:
+        stats = self._models.get(model)
+        if stats is None:
+            stats = self._models.setdefault(model, ModelStats(model=model))
+        return stats
+
+    def _match(self, rule: Rule, prompt: str, tier: str) -> bool:
+        n = len(prompt)
+        if rule.max_prompt is not None and n > rule.max_prompt:
+            return False
+        if rule.min_prompt is not None and n < rule.min_prompt:
+            return False
+        if rule.tiers is not None and tier not in rule.tiers:
+            return False
+
+        stats = self._stats(rule.model)
+        if rule.max_in_flight is not None and stats.in_flight >= rule.max_in_flight:
+            return False
+        if rule.max_hourly_cost is not None and \
+                stats.hour == _hour() and stats.hour_cost >= rule.max_hourly_cost:
+            return False
+        if rule.max_latency is not None and stats.latency > rule.max_latency:
+            now = time.time()
+            if now - stats.observed_at < self.retry:
+                return False
+            stats.observed_at = now  # this ask probes it, others keep skipping it
+        return True
+
+    def route(self, prompt: str, tier: str = "") -> str:
+        """the model to ask prompt with, counted in flight until observe() or release()"""
+        with self._lock:
+            model = next((r.model for r in self.rules if self._match(r, prompt, tier)),
+                         self.default)
+            self._stats(model).in_flight += 1
+        return model
+
+    def release(self, model: str):
+        """An ask routed to model was not sent (rate limited) or cancelled: no stats."""
+        with self._lock:
+            stats = self._stats(model)
+            stats.in_flight = max(stats.in_flight - 1, 0)
+
+    def observe(self, model: str, latency: float, tokens: int, ok: bool = True):
+        """Feed back an ask routed to model: took latency seconds & used tokens."""
+        cost = tokens / 1000 * PRICES.get(model, 0)
+        with self._lock:
+            stats = self._stats(model)
+            stats.in_flight = max(stats.in_flight - 1, 0)
+            stats.requests += 1
+            if not ok:
+                stats.errors += 1
+            # failed asks count too: a timing-out model should be skipped
+            if stats.requests == 1:
+                stats.latency = latency
+            else:
+                stats.latency += self.smoothing * (latency - stats.latency)
+            stats.tokens += tokens
+            stats.cost += cost
+            hour = _hour()
+            if stats.hour != hour:
+                stats.hour, stats.hour_cost = hour, 0
+            stats.hour_cost += cost
+            stats.observed_at = time.time()
+
+    def models(self) -> List[ModelStats]:
+        """a snapshot of the per-model stats, ordered by model"""
+        with self._lock:
+            return [ModelStats(**vars(s)) for _, s in sorted(self._models.items())]
+
+
+def _hour() -> int:
+    return int(time.time() // 3600)
@@ -0,0 +1,22 @@
+import os
+import sys
+import threading
+
+import pytest
+
+# the modules in chatgpt/ import each other by bare name
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "chatgpt"))
+
+
+@pytest.fixture
+def fake_upstream(monkeypatch):
+    """replay.FakeUpstream on a free port, as the V3 API_URL"""
+    from replay import FakeUpstream
+
+    upstream = FakeUpstream(("localhost", 0), ttfb=0.05, tps=1000, reply_chars=40, rpm=10 ** 6)
+    threading.Thread(target=upstream.serve_forever, daemon=True).start()
+    host, port = upstream.server_address[:2]
+    monkeypatch.setenv("API_URL", f"http://{host}:{port}/v1/chat/completions")
+    yield upstream
+    upstream.shutdown()
+    upstream.server_close()
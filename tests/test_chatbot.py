@@ -0,0 +1,22 @@
+import uuid
+
+import pytest
+
+import chatbot
+from chatbot import ChatGPTv3
+from cooldown import CooldownException, TokenBudget
+
+
+def test_direct_ask_does_not_wait_for_the_budget(monkeypatch):
+    budget = TokenBudget(tpm=40000, max_wait=600)
+    monkeypatch.setattr(chatbot, "v3_token_budget", budget)
+    key = "sk-test-" + uuid.uuid4().hex
+    budget.reserve(key, 40000)  # empty: the next 3000 in 4.5s
+
+    with pytest.raises(CooldownException):
+        ChatGPTv3({"api_key": key}).ask("", "hi")  # rejected, not slept on
+
+    # a queued ask may wait, up to max_wait, on the dispatcher's timer
+    admission = ChatGPTv3({"api_key": key}).admit()
+    assert admission.ready_at > budget._keys[key].updated_at
+    admission.cancel()
@@ -0,0 +1,46 @@
+import pytest
+
+from chatbot import chunk_sentences
+
+CASES = [
+    # (text, sentences)
+    ("你好。今天天气不错！", ["你好。", "今天天气不错！"]),
+    ("Hello. 你好！", ["Hello.", " 你好！"]),
+    ("真的吗？！」好。", ["真的吗？！」", "好。"]),
+    ("嗯……好吧", ["嗯……", "好吧"]),
+    ("line one\nline two", ["line one\n", "line two"]),
+    # periods that do not end a sentence
+    ("Pi is 3.14. OK", ["Pi is 3.14.", " OK"]),
+    ("see example.com. Bye", ["see example.com.", " Bye"]),
+    ("Use e.g. this one. Done", ["Use e.g. this one.", " Done"]),
+    ("i.e. 也就是说。好", ["i.e. 也就是说。", "好"]),
+    ("Dr. Who 来了。好", ["Dr. Who 来了。", "好"]),
+    ("U.S. is big. 美国很大。", ["U.S. is big.", " 美国很大。"]),
+    ("I said no. Then", ["I said no.", " Then"]),
+    ("I like plan B. It is good. Yes", ["I like plan B.", " It is good.", " Yes"]),
+    ("So do I. Then we go", ["So do I.", " Then we go"]),
+    # clauses, once long enough (min_clause=20)
+    ("短句，不切。", ["短句，不切。"]),
+    ("第一，第二，这是一个很长的从句，一直写下去，然后结束。",
+     ["第一，第二，这是一个很长的从句，一直写下去，", "然后结束。"]),
+    ("Well, this is a rather long clause, and then it ends.",
+     ["Well, this is a rather long clause,", " and then it ends."]),
+    ("The total cost is about 12,000 dollars. OK",
+     ["The total cost is about 12,000 dollars.", " OK"]),
+    ("总共大约 12,000 元，这个价格还算可以接受吧。好",
+     ["总共大约 12,000 元，这个价格还算可以接受吧。", "好"]),
+    # the last sentence, incomplete
+    ("", []),
+    ("没有结尾", ["没有结尾"]),
+]
+
+
+@pytest.mark.parametrize("text, sentences", CASES)
+def test_chunk_sentences(text, sentences):
+    assert list(chunk_sentences([text])) == sentences
+
+
+@pytest.mark.parametrize("text, sentences", CASES)
+def test_chunk_sentences_streamed(text, sentences):
+    # deltas of a char each: the same sentences as the whole text
+    assert list(chunk_sentences(text)) == sentences
@@ -0,0 +1,218 @@
+import pytest
+
+import cooldown
+from cooldown import AdaptiveCooldown, CooldownException, TokenBudget, _int_header, parse_duration
+
+
+class FakeClock:
+    """cooldown's time module, at a time set by the test"""
+
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def time(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    c = FakeClock()
+    monkeypatch.setattr(cooldown, "time", c)
+    return c
+
+
+def remaining(budget: TokenBudget, key: str = "k") -> float:
+    return budget._bucket(key, cooldown.time.time()).tokens
+
+
+@pytest.mark.parametrize("s, seconds", [
+    ("1m30s", 90),
+    ("250ms", 0.25),
+    ("6m0s", 360),
+    ("1h2m3.5s", 3723.5),
+    ("20", 20),
+    (2.5, 2.5),
+    (None, 0),
+    ("soon", 0),
+])
+def test_parse_duration(s, seconds):
+    assert parse_duration(s) == pytest.approx(seconds)
+
+
+@pytest.mark.parametrize("value, expected", [("60", 60), ("", None), ("x", None), (None, None)])
+def test_int_header(value, expected):
+    headers = {} if value is None else {"x-ratelimit-limit-requests": value}
+    assert _int_header(headers, "x-ratelimit-limit-requests") == expected
+
+
+# AdaptiveCooldown
+
+def new_cooldown():
+    return AdaptiveCooldown(seconds=10, min_seconds=1, max_seconds=60)
+
+
+def test_cooldown_acquire(clock):
+    c = new_cooldown()
+    c.acquire("k")
+    with pytest.raises(CooldownException):
+        c.acquire("k")
+    c.acquire("other")  # keys are apart
+    clock.now += 10
+    c.acquire("k")
+
+
+def test_cooldown_check_takes_nothing(clock):
+    c = new_cooldown()
+    c.check("k")
+    c.check("k")
+    c.acquire("k")
+    with pytest.raises(CooldownException):
+        c.check("k")
+
+
+def test_cooldown_acquire_at(clock):
+    c = new_cooldown()
+    c.acquire("k", at=clock.now + 5)  # a request sent later
+    clock.now += 10
+    with pytest.raises(CooldownException):
+        c.acquire("k")  # 10s after that one, not after acquire()
+    clock.now += 5
+    c.acquire("k")
+
+
+def test_cooldown_backs_off_on_429(clock):
+    c = new_cooldown()
+    c.observe("k", 429, {"retry-after": "30"})
+    assert c._keys["k"].interval == 20  # slowdown: x2
+    assert c._keys["k"].blocked_until == clock.now + 30
+    clock.now += 29
+    with pytest.raises(CooldownException):
+        c.acquire("k")
+    clock.now += 1
+    c.acquire("k")
+
+
+def test_cooldown_429_without_retry_after(clock):
+    c = new_cooldown()
+    c.observe("k", 429, {"x-ratelimit-reset-requests": "1m30s"})
+    assert c._keys["k"].blocked_until == clock.now + 90
+    c.observe("k", 429, {})
+    assert c._keys["k"].interval == 40
+    c.observe("k", 429, {})
+    assert c._keys["k"].interval == 60  # max_seconds
+
+
+def test_cooldown_recovers_with_headroom(clock):
+    c = new_cooldown()
+    c.observe("k", 200, {"x-ratelimit-limit-requests": "60",
+                         "x-ratelimit-remaining-requests": "30"})
+    assert c._keys["k"].interval == pytest.approx(9.5)  # speedup: x0.95
+    # little headroom left: no speedup
+    c.observe("k", 200, {"x-ratelimit-limit-requests": "60",
+                         "x-ratelimit-remaining-requests": "6"})
+    assert c._keys["k"].interval == pytest.approx(9.5)
+    # no rate-limit headers: unchanged
+    c.observe("k", 200, {})
+    assert c._keys["k"].interval == pytest.approx(9.5)
+
+
+def test_cooldown_not_below_advertised_limit(clock):
+    c = AdaptiveCooldown(seconds=2, min_seconds=0.1, max_seconds=60)
+    for _ in range(100):
+        c.observe("k", 200, {"x-ratelimit-limit-requests": "20",
+                             "x-ratelimit-remaining-requests": "19"})
+    assert c._keys["k"].interval == pytest.approx(3)  # 60 / 20 RPM
+    assert c.rate("k") == pytest.approx(20)
+
+
+def test_cooldown_blocks_until_reset_when_exhausted(clock):
+    c = new_cooldown()
+    c.observe("k", 200, {"x-ratelimit-limit-requests": "60",
+                         "x-ratelimit-remaining-requests": "0",
+                         "x-ratelimit-reset-requests": "250ms"})
+    assert c._keys["k"].blocked_until == pytest.approx(clock.now + 0.25)
+    assert c._keys["k"].interval == 10
+
+
+# TokenBudget
+
+def test_budget_reserve_now(clock):
+    budget = TokenBudget(tpm=6000, max_wait=10)
+    assert budget.reserve("k", 1000) == clock.now
+    assert remaining(budget) == 5000
+
+
+def test_budget_refills(clock):
+    budget = TokenBudget(tpm=6000, max_wait=10)
+    budget.reserve("k", 6000)
+    clock.now += 5  # 100 tokens / second
+    assert remaining(budget) == pytest.approx(500)
+    clock.now += 600
+    assert remaining(budget) == 6000  # not above the capacity
+
+
+def test_budget_goes_negative_and_schedules(clock):
+    budget = TokenBudget(tpm=6000, max_wait=10)
+    budget.reserve("k", 6000)
+    assert budget.reserve("k", 300) == pytest.approx(clock.now + 3)
+    assert remaining(budget) == pytest.approx(-300)
+    # in arrival order: the next one after the first is refilled too
+    assert budget.reserve("k", 300) == pytest.approx(clock.now + 6)
+
+
+def test_budget_rejects_beyond_max_wait(clock):
+    budget = TokenBudget(tpm=6000, max_wait=10)
+    budget.reserve("k", 6000)
+    with pytest.raises(CooldownException):
+        budget.reserve("k", 1500)  # 15 seconds
+    assert remaining(budget) == 0  # nothing taken
+
+
+def test_budget_keys_are_apart(clock):
+    budget = TokenBudget(tpm=6000, max_wait=10)
+    budget.reserve("a", 6000)
+    assert budget.reserve("b", 6000) == clock.now
+
+
+def test_budget_release_gives_back_unsent(clock):
+    budget = TokenBudget(tpm=6000, max_wait=10)
+    budget.reserve("k", 3000)
+    budget.release("k", 3000)
+    assert remaining(budget) == 6000
+
+
+def test_budget_commit_is_not_given_back(clock):
+    budget = TokenBudget(tpm=6000, max_wait=10)
+    budget.reserve("k", 3000)
+    budget.commit("k", 3000)
+    budget.release("k", 3000)  # too late: sent
+    assert remaining(budget) == 3000
+
+
+def test_budget_observe_syncs_with_upstream(clock):
+    budget = TokenBudget(tpm=6000, max_wait=10)
+    budget.observe("k", {"x-ratelimit-limit-tokens": "12000",
+                         "x-ratelimit-remaining-tokens": "4000"})
+    assert budget._keys["k"].capacity == 12000
+    assert remaining(budget) == 4000
+
+
+def test_budget_observe_keeps_unsent_reservations(clock):
+    budget = TokenBudget(tpm=6000, max_wait=10)
+    budget.reserve("k", 1000)  # not sent: upstream does not count it yet
+    budget.observe("k", {"x-ratelimit-remaining-tokens": "4000"})
+    assert remaining(budget) == 3000
+    budget.release("k", 1000)
+    assert remaining(budget) == 4000  # not above what upstream has left
+
+
+def test_budget_reserve_no_wait(clock):
+    budget = TokenBudget(tpm=6000, max_wait=10)
+    budget.reserve("k", 6000)
+    with pytest.raises(CooldownException):
+        budget.reserve("k", 100, max_wait=0)  # would be 1 second
+    clock.now += 1
+    assert budget.reserve("k", 100, max_wait=0) == clock.now
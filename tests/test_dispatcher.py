@@ -0,0 +1,147 @@
+import threading
+import time
+
+import pytest
+
+from dispatcher import Dispatcher, Overloaded, SessionQueueFull
+
+
+class FakeAdmission:
+    def __init__(self, delay: float):
+        self.ready_at = time.time() + delay
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+@pytest.fixture
+def dispatcher():
+    d = Dispatcher(workers=2, max_queued=10, max_depth=4)
+    yield d
+    d.shutdown()
+
+
+def blocker(d: Dispatcher, key="blocker"):
+    """occupy a worker until the returned event is set"""
+    release, started = threading.Event(), threading.Event()
+
+    def block():
+        started.set()
+        release.wait(5)
+
+    future = d.submit(key, block)
+    assert started.wait(5)
+    return release, future
+
+
+def test_session_calls_run_in_order(dispatcher):
+    done = []
+
+    def call(i):
+        time.sleep(0.01 * (3 - i))  # the first is the slowest
+        done.append(i)
+        return i
+
+    futures = [dispatcher.submit("s", call, i) for i in range(3)]
+    assert [f.result(5) for f in futures] == [0, 1, 2]
+    assert done == [0, 1, 2]
+
+
+def test_sessions_run_concurrently(dispatcher):
+    both = threading.Barrier(2)  # broken if one waits for the other
+    futures = [dispatcher.submit(key, both.wait, 5) for key in ("a", "b")]
+    for f in futures:
+        f.result(5)
+
+
+def test_session_queue_full():
+    d = Dispatcher(workers=1, max_queued=10, max_depth=2)
+    release, _ = blocker(d, key="s")
+    d.submit("s", lambda: None)
+    with pytest.raises(SessionQueueFull):
+        d.submit("s", lambda: None)
+    d.submit("other", lambda: None)  # other sessions are not affected
+    release.set()
+    d.shutdown()
+
+
+def test_overloaded():
+    d = Dispatcher(workers=1, max_queued=1, max_depth=4)
+    release, _ = blocker(d)
+    d.submit("a", lambda: None)
+    with pytest.raises(Overloaded) as e:
+        d.submit("b", lambda: None)
+    assert e.value.retry_after >= 1
+    release.set()
+    d.shutdown()
+
+
+def test_cancelled_call_is_dropped():
+    d = Dispatcher(workers=1, max_queued=10, max_depth=4)
+    release, _ = blocker(d)
+    called = []
+    future = d.submit("s", called.append, 1)
+    assert d.queued == 1 and d.depth("s") == 1
+    assert future.cancel()
+    assert d.queued == 0 and d.depth("s") == 0
+    after = d.submit("s", called.append, 2)
+    release.set()
+    after.result(5)
+    assert called == [2]
+    d.shutdown()
+
+
+def test_admission_is_passed_to_the_call(dispatcher):
+    admission = FakeAdmission(0)
+    future = dispatcher.submit("s", lambda admission: admission, admit=lambda: admission)
+    assert future.result(5) is admission
+
+
+def test_delayed_call_does_not_hold_a_worker():
+    d = Dispatcher(workers=1, max_queued=10, max_depth=4)
+    done = []
+    called = threading.Event()
+    delayed = d.submit("a", lambda admission: done.append("a"),
+                       admit=lambda: called.set() or FakeAdmission(60))
+    assert called.wait(5)
+    d.submit("b", lambda: done.append("b")).result(5)  # the only worker was free
+    assert done == ["b"] and not delayed.done()
+    assert delayed.cancel()
+    d.shutdown()
+
+
+def test_delayed_call_keeps_session_order(dispatcher):
+    done = []
+    first = dispatcher.submit("s", lambda admission: done.append(1),
+                              admit=lambda: FakeAdmission(0.2))
+    second = dispatcher.submit("s", lambda: done.append(2))
+    second.result(5)
+    assert first.done() and done == [1, 2]
+
+
+def test_cancelled_delayed_call_gives_back_its_admission(dispatcher):
+    admission = FakeAdmission(60)
+    called = threading.Event()
+    future = dispatcher.submit("s", lambda admission: None,
+                               admit=lambda: called.set() or admission)
+    assert called.wait(5)
+    assert future.cancel()
+    assert admission.cancelled
+    # the next call does not wait for the cancelled one's timer (60s)
+    dispatcher.submit("s", lambda: None).result(5)
+    assert dispatcher.queued == 0
+
+
+def test_rejected_admission_fails_the_call(dispatcher):
+    called = []
+
+    def reject():
+        raise RuntimeError("rate limited")
+
+    future = dispatcher.submit("s", called.append, 1, admit=reject)
+    with pytest.raises(RuntimeError):
+        future.result(5)
+    dispatcher.submit("s", called.append, 2).result(5)
+    assert called == [2]
+    assert dispatcher.queued == 0 and dispatcher.depth("s") == 0
@@ -0,0 +1,131 @@
+import json
+import logging
+import queue
+import sys
+
+import pytest
+
+import eventlog
+from eventlog import Event, JSONFormatter, _LazyQueueHandler, _parse_sampling, _truncate, log_event
+
+
+class Recorder(logging.Handler):
+    def __init__(self):
+        super().__init__(logging.DEBUG)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+@pytest.fixture
+def logger():
+    logger = logging.getLogger("test_eventlog")
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
+    handler = Recorder()
+    logger.addHandler(handler)
+    yield logger
+    logger.removeHandler(handler)
+
+
+def records(logger):
+    return logger.handlers[0].records
+
+
+def record(msg, exc_info=None) -> logging.LogRecord:
+    return logging.LogRecord("test", logging.ERROR, __file__, 1, msg, None, exc_info)
+
+
+def test_parse_sampling():
+    assert _parse_sampling("Chat.ok=0.1, NewSession.ok=1,,bad") == \
+        {"Chat.ok": 0.1, "NewSession.ok": 1.0}
+
+
+def test_sampling_drops_events_below_warning(logger, monkeypatch):
+    monkeypatch.setattr(eventlog, "LOG_SAMPLING", {"Chat.ok": 0.25})
+    monkeypatch.setattr(eventlog.random, "random", lambda: 0.5)
+    log_event(logging.INFO, "Chat.ok", logger=logger)
+    assert records(logger) == []
+    monkeypatch.setattr(eventlog.random, "random", lambda: 0.1)
+    log_event(logging.INFO, "Chat.ok", logger=logger)
+    assert len(records(logger)) == 1
+
+
+def test_sampling_keeps_warnings_and_other_events(logger, monkeypatch):
+    monkeypatch.setattr(eventlog, "LOG_SAMPLING", {"Chat.ok": 0, "Chat.error": 0})
+    log_event(logging.WARNING, "Chat.error", logger=logger)
+    log_event(logging.INFO, "NewSession.ok", logger=logger)
+    assert [r.msg.event for r in records(logger)] == ["Chat.error", "NewSession.ok"]
+
+
+def test_disabled_level_is_not_logged(logger):
+    logger.setLevel(logging.INFO)
+    log_event(logging.DEBUG, "TokenBudget.wait", logger=logger, wait=1)
+    assert records(logger) == []
+
+
+def test_event_is_formatted_lazily(logger):
+    fields = {"n": 1}
+    log_event(logging.INFO, "Chat.ok", logger=logger, **fields)
+    msg = records(logger)[0].msg
+    assert isinstance(msg, Event)  # not a str yet
+    assert str(msg) == "Chat.ok: n=1"
+
+
+def test_truncate():
+    assert _truncate("abc", 5) == "abc"
+    assert _truncate("abcdefgh", 5) == "abcde...(8 chars)"
+
+
+def test_event_truncates_bodies(monkeypatch):
+    monkeypatch.setattr(eventlog, "LOG_MAX_BODY", 4)
+    e = Event("Chat.ok", {"prompt": "你好你好你好", "session_id": "s" * 10})
+    assert e.as_dict() == {"prompt": "你好你好...(6 chars)", "session_id": "s" * 10}
+    assert str(e) == "Chat.ok: prompt='你好你好...(6 chars)' session_id='ssssssssss'"
+
+
+def test_event_omits_bodies(monkeypatch):
+    monkeypatch.setattr(eventlog, "LOG_MAX_BODY", 0)
+    assert Event("Chat.ok", {"response": "hi", "n": 1}).as_dict() == {"n": 1}
+
+
+def test_json_formatter_event():
+    d = json.loads(JSONFormatter().format(record(Event("Chat.ok", {"session_id": "s", "n": 1}))))
+    assert d["event"] == "Chat.ok" and d["level"] == "ERROR" and d["logger"] == "test"
+    assert d["session_id"] == "s" and d["n"] == 1
+
+
+def test_json_formatter_renames_reserved_fields():
+    e = Event("Chat.ok", {"ts": "oops", "event": "x", "exc": "y", "n": 1})
+    d = json.loads(JSONFormatter().format(record(e)))
+    assert d["event"] == "Chat.ok" and isinstance(d["ts"], float)
+    assert d["field.ts"] == "oops" and d["field.event"] == "x" and d["field.exc"] == "y"
+    assert "exc" not in d and d["n"] == 1
+
+
+def test_json_formatter_message_and_traceback():
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        r = record("failed: %s", sys.exc_info())
+    r.args = ("ask",)
+    d = json.loads(JSONFormatter().format(r))
+    assert d["msg"] == "failed: ask"
+    assert "ValueError: boom" in d["exc"]
+
+
+def test_queue_handler_keeps_events_and_exc_info():
+    handler = _LazyQueueHandler(queue.SimpleQueue())
+    e = record(Event("Chat.ok", {"n": 1}))
+    assert handler.prepare(e) is e
+
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        r = record("failed: %s", sys.exc_info())
+    r.args = ("ask",)
+    prepared = handler.prepare(r)
+    assert prepared.msg == "failed: ask" and prepared.args is None
+    assert prepared.exc_info is not None  # for the listener's formatter
+    assert r.args == ("ask",)  # the caller's record is not changed
@@ -0,0 +1,171 @@
+import asyncio
+import json
+import threading
+import uuid
+
+import grpc
+import pytest
+
+import grpcapi
+from chatbot import APIVersion, ChatGPTConfig, MultiChatGPT
+from protos import chatbot_pb2, chatbot_pb2_grpc
+
+
+def new_key() -> str:
+    # v3_cooldown is per api_key and shared by the tests: a key per session
+    return "sk-test-" + uuid.uuid4().hex
+
+
+def v3_config() -> str:
+    return json.dumps({"version": 3, "api_key": new_key()})
+
+
+async def start(servicer: grpcapi.ChatGPTgRPCServer):
+    server = grpc.aio.server()
+    chatbot_pb2_grpc.add_ChatbotServiceServicer_to_server(servicer, server)
+    port = server.add_insecure_port("localhost:0")
+    await server.start()
+    channel = grpc.aio.insecure_channel(f"localhost:{port}")
+    return server, channel, chatbot_pb2_grpc.ChatbotServiceStub(channel)
+
+
+async def wait_until(cond, timeout: float = 5):
+    for _ in range(int(timeout / 0.01)):
+        if cond():
+            return
+        await asyncio.sleep(0.01)
+    raise TimeoutError
+
+
+def test_overloaded_sets_retry_after():
+    async def run():
+        servicer = grpcapi.ChatGPTgRPCServer()
+        servicer.multiChatGPT.dispatcher.shutdown()
+        servicer.multiChatGPT = MultiChatGPT(workers=1, max_queued=1, max_session_queue=4)
+        dispatcher = servicer.multiChatGPT.dispatcher
+        server, channel, stub = await start(servicer)
+
+        release, started = threading.Event(), threading.Event()
+        try:
+            dispatcher.submit("a", lambda: started.set() or release.wait(5))
+            assert started.wait(5)  # running
+            dispatcher.submit("b", release.wait, 5)  # queued: the queue is full
+            with pytest.raises(grpc.aio.AioRpcError) as e:
+                await stub.NewSession(chatbot_pb2.NewSessionRequest(config=v3_config()))
+            assert e.value.code() == grpc.StatusCode.RESOURCE_EXHAUSTED
+            retry_after = e.value.trailing_metadata()["retry-after"]
+            assert int(retry_after) >= 1
+        finally:
+            release.set()
+            await channel.close()
+            await server.stop(0)
+            dispatcher.shutdown()
+
+    asyncio.run(run())
+
+
+def test_session_queue_full():
+    async def run():
+        servicer = grpcapi.ChatGPTgRPCServer()
+        servicer.multiChatGPT.dispatcher.shutdown()
+        servicer.multiChatGPT = MultiChatGPT(workers=2, max_queued=10, max_session_queue=1)
+        dispatcher = servicer.multiChatGPT.dispatcher
+        server, channel, stub = await start(servicer)
+
+        release = threading.Event()
+        try:
+            sid = (await stub.NewSession(chatbot_pb2.NewSessionRequest(config=v3_config()))).session_id
+            dispatcher.submit(sid, release.wait, 5)  # the session is busy
+            with pytest.raises(grpc.aio.AioRpcError) as e:
+                await stub.Chat(chatbot_pb2.ChatRequest(session_id=sid, prompt="hi"))
+            assert e.value.code() == grpc.StatusCode.RESOURCE_EXHAUSTED
+            assert "busy" in e.value.details()
+        finally:
+            release.set()
+            await channel.close()
+            await server.stop(0)
+            dispatcher.shutdown()
+
+    asyncio.run(run())
+
+
+def test_draining_rejects_new_sessions():
+    async def run():
+        servicer = grpcapi.ChatGPTgRPCServer()
+        server, channel, stub = await start(servicer)
+        try:
+            servicer.draining = True
+            with pytest.raises(grpc.aio.AioRpcError) as e:
+                await stub.NewSession(chatbot_pb2.NewSessionRequest(config=v3_config()))
+            assert e.value.code() == grpc.StatusCode.UNAVAILABLE
+            assert e.value.details() == "server is draining"
+        finally:
+            await channel.close()
+            await server.stop(0)
+            servicer.multiChatGPT.dispatcher.shutdown()
+
+    asyncio.run(run())
+
+
+def test_drain_finishes_in_flight_calls(fake_upstream):
+    async def run():
+        servicer = grpcapi.ChatGPTgRPCServer()
+        dispatcher = servicer.multiChatGPT.dispatcher
+        server, channel, stub = await start(servicer)
+        stopped = None
+        try:
+            sid = (await stub.NewSession(chatbot_pb2.NewSessionRequest(config=v3_config()))).session_id
+            chat = asyncio.ensure_future(stub.Chat(chatbot_pb2.ChatRequest(session_id=sid, prompt="hi")))
+            await wait_until(lambda: dispatcher.depth(sid) == 1)  # the call is in
+
+            stopped = grpcapi._drain(server, servicer, grace=10)
+            assert servicer.draining
+            with pytest.raises(grpc.aio.AioRpcError):  # stopping: no new calls
+                await stub.NewSession(chatbot_pb2.NewSessionRequest(config=v3_config()))
+
+            response = await chat  # in flight: not cut by the drain
+            assert response.response
+            await stopped
+        finally:
+            await channel.close()
+            if stopped is None:
+                await server.stop(0)
+            dispatcher.shutdown()
+
+    asyncio.run(run())
+
+
+def list_sessions(servicer: grpcapi.ChatGPTgRPCServer, page_token: str = "", page_size: int = 2):
+    request = chatbot_pb2.ListSessionsRequest(page_size=page_size, page_token=page_token)
+    return asyncio.run(servicer.ListSessions(request, None))
+
+
+def test_list_sessions_pages():
+    servicer = grpcapi.ChatGPTgRPCServer()
+    multi = servicer.multiChatGPT
+    try:
+        sids = sorted(multi.new_session(ChatGPTConfig(APIVersion.V3, new_key(), ""))
+                      for _ in range(5))
+
+        seen = []
+        token = ""
+        while True:
+            page = list_sessions(servicer, token)
+            assert page.total_size == 5
+            seen += [s.session_id for s in page.sessions]
+            token = page.next_page_token
+            if not token:
+                break
+        assert seen == sids  # ordered, no overlap, none skipped
+
+        first = list_sessions(servicer)
+        assert [s.session_id for s in first.sessions] == sids[:2]
+        multi.delete(first.next_page_token)  # the last one of the page
+        second = list_sessions(servicer, first.next_page_token)
+        assert [s.session_id for s in second.sessions] == sids[2:4]
+        assert second.total_size == 4
+        third = list_sessions(servicer, second.next_page_token)
+        assert [s.session_id for s in third.sessions] == sids[4:]
+        assert third.next_page_token == ""
+    finally:
+        multi.dispatcher.shutdown()
@@ -0,0 +1,78 @@
+import asyncio
+import json
+import threading
+import uuid
+
+import grpc
+import pytest
+
+import grpcapi
+import replay
+from protos import chatbot_pb2, chatbot_pb2_grpc
+from recorder import TraceRecorder
+
+
+@pytest.fixture
+def server():
+    """a grpcapi server on a free port, in a loop thread -> (servicer, address)"""
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+
+    async def start():
+        servicer = grpcapi.ChatGPTgRPCServer()
+        server = grpc.aio.server()
+        chatbot_pb2_grpc.add_ChatbotServiceServicer_to_server(servicer, server)
+        port = server.add_insecure_port("localhost:0")
+        await server.start()
+        return server, servicer, port
+
+    # keep a reference: a grpc.aio server is stopped when collected
+    server, servicer, port = asyncio.run_coroutine_threadsafe(start(), loop).result(5)
+    yield servicer, f"localhost:{port}"
+    asyncio.run_coroutine_threadsafe(server.stop(0), loop).result(5)
+    servicer.multiChatGPT.dispatcher.shutdown()
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(5)
+
+
+def config(version=3) -> str:
+    return json.dumps({"version": version, "api_key": "sk-test-" + uuid.uuid4().hex})
+
+
+def record(stub):
+    """some RPCs, failing ones too"""
+    # a session per call: the cooldown is per api_key
+    sids = [stub.NewSession(chatbot_pb2.NewSessionRequest(config=config())).session_id
+            for _ in range(2)]
+    stub.Chat(chatbot_pb2.ChatRequest(session_id=sids[0], prompt="你好"))
+    list(stub.ChatStream(chatbot_pb2.ChatRequest(session_id=sids[1], prompt="hello")))
+    failing = [
+        (stub.NewSession, chatbot_pb2.NewSessionRequest(config=config(None))),
+        (stub.Chat, chatbot_pb2.ChatRequest(session_id="nope", prompt="hi")),
+        (stub.Chat, chatbot_pb2.ChatRequest(session_id="", prompt="hi")),
+    ]
+    for method, request in failing:
+        with pytest.raises(grpc.RpcError):
+            method(request)
+    stub.DeleteSession(chatbot_pb2.DeleteSessionRequest(session_id=sids[0]))
+
+
+def test_replay_round_trip(server, fake_upstream, tmp_path):
+    servicer, address = server
+    trace = tmp_path / "trace.jsonl"
+    servicer.recorder = TraceRecorder(str(trace))
+    with grpc.insecure_channel(address) as channel:
+        record(chatbot_pb2_grpc.ChatbotServiceStub(channel))
+    servicer.recorder.close()
+    servicer.recorder = None
+
+    _, records = replay.load_trace(str(trace))
+    recorded = sorted((r["rpc"], r["code"]) for r in records)
+    assert ("NewSession", "INVALID_ARGUMENT") in recorded
+    assert ("Chat", "NOT_FOUND") in recorded
+    assert ("Chat", "INVALID_ARGUMENT") in recorded
+
+    replayer = replay.Replayer(address, speed=100, timeout=10, concurrency=4)
+    replayer.run(records)
+    assert sorted((r["rpc"], r["code"]) for r in replayer.results) == recorded
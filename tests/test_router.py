@@ -0,0 +1,116 @@
+import pytest
+
+import router
+from router import ModelRouter, Rule, parse_rules
+
+
+class FakeClock:
+    """router's time module, at a time set by the test"""
+
+    def __init__(self, now: float = 3600 * 1000.0):
+        self.now = now
+
+    def time(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    c = FakeClock()
+    monkeypatch.setattr(router, "time", c)
+    return c
+
+
+def stats(r: ModelRouter, model: str) -> router.ModelStats:
+    return next(s for s in r.models() if s.model == model)
+
+
+def test_parse_rules():
+    rules = parse_rules('[{"model": "gpt-4", "tiers": ["pro"]}, {"model": "nope"}, {"bad": 1}, '
+                        '{"model": "gpt-3.5-turbo", "max_prompt": 200}]')
+    assert rules == [Rule("gpt-4", tiers=["pro"]), Rule("gpt-3.5-turbo", max_prompt=200)]
+    assert parse_rules("") == []
+    assert parse_rules('{"model": "gpt-4"}') == []  # not a list
+
+
+def test_no_rules_routes_to_default(clock):
+    r = ModelRouter([], default="gpt-3.5-turbo")
+    assert r.route("hi") == "gpt-3.5-turbo"
+
+
+def test_first_matching_rule_wins(clock):
+    r = ModelRouter([Rule("gpt-4", tiers=["pro"]),
+                     Rule("gpt-4-32k", tiers=["pro", "free"]),
+                     Rule("gpt-3.5-turbo-0301")], default="gpt-3.5-turbo")
+    assert r.route("hi", "pro") == "gpt-4"
+    assert r.route("hi", "free") == "gpt-4-32k"  # falls through
+    assert r.route("hi", "") == "gpt-3.5-turbo-0301"
+
+
+def test_tier_and_prompt_length(clock):
+    r = ModelRouter([Rule("gpt-3.5-turbo-0301", max_prompt=5),
+                     Rule("gpt-4", min_prompt=10, tiers=["pro"])], default="gpt-3.5-turbo")
+    assert r.route("12345") == "gpt-3.5-turbo-0301"
+    assert r.route("123456") == "gpt-3.5-turbo"
+    assert r.route("1234567890", "pro") == "gpt-4"
+    assert r.route("1234567890", "free") == "gpt-3.5-turbo"
+    assert r.route("123456789", "pro") == "gpt-3.5-turbo"
+
+
+def test_max_in_flight(clock):
+    r = ModelRouter([Rule("gpt-4", max_in_flight=2)], default="gpt-3.5-turbo")
+    assert r.route("a") == "gpt-4"
+    assert r.route("b") == "gpt-4"
+    assert r.route("c") == "gpt-3.5-turbo"  # gpt-4 is full
+    assert stats(r, "gpt-4").in_flight == 2
+
+    r.release("gpt-4")  # not sent
+    assert r.route("d") == "gpt-4"
+    r.observe("gpt-4", latency=1, tokens=10)
+    assert stats(r, "gpt-4").in_flight == 1
+    assert r.route("e") == "gpt-4"
+
+
+def test_latency_ewma(clock):
+    r = ModelRouter([], default="gpt-4", smoothing=0.5)
+    r.observe("gpt-4", latency=10, tokens=0)
+    assert stats(r, "gpt-4").latency == 10  # the first one as is
+    r.observe("gpt-4", latency=20, tokens=0, ok=False)
+    s = stats(r, "gpt-4")
+    assert s.latency == 15 and s.requests == 2 and s.errors == 1
+
+
+def test_slow_model_is_probed_after_retry(clock):
+    r = ModelRouter([Rule("gpt-4", max_latency=5)], default="gpt-3.5-turbo", retry=60)
+    r.observe("gpt-4", latency=10, tokens=0)
+    assert r.route("a") == "gpt-3.5-turbo"  # too slow
+    clock.now += 59
+    assert r.route("b") == "gpt-3.5-turbo"
+
+    clock.now += 1
+    assert r.route("probe") == "gpt-4"  # one ask probes it...
+    assert r.route("c") == "gpt-3.5-turbo"  # ...the others keep skipping it
+    r.observe("gpt-4", latency=1, tokens=0)  # recovered: 10 + 0.3 * (1 - 10) = 7.3
+    assert r.route("d") == "gpt-3.5-turbo"
+    for _ in range(3):
+        r.observe("gpt-4", latency=1, tokens=0)
+    assert stats(r, "gpt-4").latency < 5
+    assert r.route("e") == "gpt-4"
+
+
+def test_hourly_cost(clock):
+    # gpt-4: $0.045 / 1K tokens
+    r = ModelRouter([Rule("gpt-4", max_hourly_cost=0.09)], default="gpt-3.5-turbo")
+    r.observe("gpt-4", latency=1, tokens=1000)
+    assert r.route("a") == "gpt-4"
+    r.observe("gpt-4", latency=1, tokens=1000)
+    assert stats(r, "gpt-4").hour_cost == pytest.approx(0.09)
+    assert r.route("b") == "gpt-3.5-turbo"  # spent this hour
+
+    clock.now += 3600  # the next hour: not spent yet
+    assert r.route("c") == "gpt-4"
+    r.observe("gpt-4", latency=1, tokens=1000)
+    s = stats(r, "gpt-4")
+    assert s.hour_cost == pytest.approx(0.045)  # reset, then this ask
+    assert s.cost == pytest.approx(0.135)  # since start
+    assert s.tokens == 3000